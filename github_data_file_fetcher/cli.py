@@ -4,7 +4,7 @@ import argparse
 from pathlib import Path
 
 
-def main():
+def main(argv: list[str] | None = None):
     parser = argparse.ArgumentParser(
         description="Collect files from GitHub",
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -175,7 +175,7 @@ def main():
         help="GraphQL query string (requires --graphql)",
     )
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     if args.command == "fetch-file-paths":
         from .fetch_file_paths import fetch_file_paths
@@ -259,10 +259,7 @@ def main():
         else:
             from . import generic_client
 
-            params = {}
-            for p in args.param:
-                k, _, v = p.partition("=")
-                params[k] = v
+            params = {k: v for k, _, v in (p.partition("=") for p in args.param)}
 
             client = generic_client.get_generic_client(skip_cache=args.skip_cache)
             resp = client.api(args.endpoint, params=params or None, method=args.method)
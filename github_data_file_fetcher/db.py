@@ -89,15 +89,13 @@ def insert_files(db_path: Path | None, files: list[dict]) -> int:
         return 0
 
     conn = get_db(db_path)
-    cursor = conn.cursor()
-
-    new_count = 0
-    for f in files:
-        try:
-            cursor.execute("INSERT INTO files (url, sha) VALUES (?, ?)", (f["html_url"], f["sha"]))
-            new_count += 1
-        except sqlite3.IntegrityError:
-            pass  # Duplicate URL
+    before = conn.total_changes
+    # OR IGNORE skips duplicate URLs; ignored rows don't count as changes
+    conn.executemany(
+        "INSERT OR IGNORE INTO files (url, sha) VALUES (?, ?)",
+        [(f["html_url"], f["sha"]) for f in files],
+    )
+    new_count = conn.total_changes - before
 
     conn.commit()
     conn.close()
@@ -2,7 +2,6 @@
 
 import json
 import sqlite3
-from pathlib import Path
 
 import pytest
 
@@ -15,7 +14,6 @@ from .db import (
     get_multi_range_hits,
     get_repos_without_metadata,
     get_scan_progress,
-    update_scan_progress,
     get_unique_repos,
     init_db,
     insert_content_status_batch,
@@ -25,6 +23,7 @@ from .db import (
     insert_repo_metadata,
     insert_repo_metadata_batch,
     insert_search_hits,
+    update_scan_progress,
 )
 
 
@@ -1,6 +1,6 @@
 """Fetch file content using GitHub GraphQL API with batching."""
 
-import base64
+import binascii
 import os
 import sys
 import threading
@@ -98,13 +98,15 @@ def fetch_file_content_graphql(
     truncated: list[tuple[str, str, str, str, str]] = []  # (url, owner, repo, ref, path) needing REST fallback
 
     try:
-        for batch_start in range(0, len(pending), batch_size):
-            batch = pending[batch_start : batch_start + batch_size]
-            items = [(owner, repo, ref, path) for _, owner, repo, ref, path in batch]
-
-            results = gql.fetch_batch(items)
-
-            for (url, owner, repo, ref, path), result in zip(batch, results):
+        batches = [pending[i : i + batch_size] for i in range(0, len(pending), batch_size)]
+        item_batches = [
+            [(owner, repo, ref, path) for _, owner, repo, ref, path in batch] for batch in batches
+        ]
+
+        for batch, results in zip(
+            batches, gql.map_batches(gql.fetch_batch, item_batches), strict=True
+        ):
+            for (url, owner, repo, ref, path), result in zip(batch, results, strict=True):
                 if result is None:
                     stats["errors"] += 1
                     status_records.append((url, "error"))
@@ -125,13 +127,15 @@ def fetch_file_content_graphql(
                     continue
 
                 if result.content_b64:
-                    content = base64.b64decode(result.content_b64).decode("utf-8", errors="replace")
+                    # Blob text arrives as UTF-8, so write the decoded bytes as-is
+                    # rather than round-tripping through str
+                    content = binascii.a2b_base64(result.content_b64)
                     local_path = resolve_content_path(
                         content_dir, result.owner, result.repo, result.ref, result.path
                     )
                     try:
                         local_path.parent.mkdir(parents=True, exist_ok=True)
-                        local_path.write_text(content)
+                        local_path.write_bytes(content)
                     except OSError:
                         stats["errors"] += 1
                         status_records.append((url, "error"))
@@ -149,13 +153,12 @@ def fetch_file_content_graphql(
                 try:
                     data = rest_client.get_file_content(owner, repo, path, ref=ref)
                     if data.get("content") is not None:
-                        content = base64.b64decode(data["content"]).decode(
-                            "utf-8", errors="replace"
-                        )
+                        # Same bytes path as Phase 2, so a file's bytes don't depend on its size
+                        content = binascii.a2b_base64(data["content"])
                         local_path = resolve_content_path(content_dir, owner, repo, ref, path)
                         try:
                             local_path.parent.mkdir(parents=True, exist_ok=True)
-                            local_path.write_text(content)
+                            local_path.write_bytes(content)
                         except OSError:
                             stats["errors"] += 1
                             status_records.append((url, "error"))
@@ -176,6 +179,7 @@ def fetch_file_content_graphql(
         pass
 
     done_event.set()
+    refresh_thread.join()
     stats["queries"] = gql.queries
     gql.close()
 
@@ -46,15 +46,18 @@ def fetch_file_history_graphql(db_path: Path, batch_size: int = DEFAULT_BATCH_SI
     total_items = len(valid) + stats["errors"]
 
     try:
-        for batch_start in range(0, len(valid), batch_size):
-            batch = valid[batch_start : batch_start + batch_size]
-            items = [(owner, repo, ref, path) for _, owner, repo, ref, path in batch]
+        batches = [valid[i : i + batch_size] for i in range(0, len(valid), batch_size)]
+        item_batches = [
+            [(owner, repo, ref, path) for _, owner, repo, ref, path in batch] for batch in batches
+        ]
+
+        for batch, results in zip(
+            batches, gql.map_batches(gql.fetch_history_batch, item_batches), strict=True
+        ):
             batch_urls = [url for url, _, _, _, _ in batch]
 
-            results = gql.fetch_history_batch(items)
-
             db_batch = []
-            for url, result in zip(batch_urls, results):
+            for url, result in zip(batch_urls, results, strict=True):
                 if result is None:
                     stats["errors"] += 1
                     continue
@@ -30,10 +30,9 @@ def fetch_repo_metadata_graphql(db_path: Path, batch_size: int = DEFAULT_BATCH_S
     stats = {"fetched": 0, "errors": 0, "cache_hits": 0}
 
     try:
-        for batch_start in range(0, len(repos), batch_size):
-            batch = repos[batch_start : batch_start + batch_size]
-            results = gql.fetch_metadata_batch(batch)
+        batches = [repos[i : i + batch_size] for i in range(0, len(repos), batch_size)]
 
+        for results in gql.map_batches(gql.fetch_metadata_batch, batches):
             db_batch = []
             for result in results:
                 if result is None:
@@ -1,28 +1,27 @@
 """Generic cached GitHub REST API client using httpx + Cachetta."""
 
-import hashlib
-import json
 import time
 from datetime import timedelta
 from pathlib import Path
 
 import httpx
-from cachetta import Cachetta
+import orjson
+from cachetta import Cachetta, read_cache
 
-from .github import BACKOFF_FACTOR, DEFAULT_CACHE_DIR, MAX_RETRIES, REQUESTS_PER_SECOND
+from .github import BACKOFF_FACTOR, DEFAULT_CACHE_DIR, MAX_RETRIES, REQUESTS_PER_SECOND, _cache_key
 from .models import ApiResponse
 from .settings import get_settings
 
 API_BASE = "https://api.github.com"
 DEFAULT_DURATION = timedelta(days=30)
+# Expired (or skip_cache) entries younger than this are revalidated with
+# If-None-Match; a 304 reuses the cached body and costs no rate limit.
+REVALIDATE_DURATION = timedelta(days=365)
 
 
 def _api_cache_path(endpoint, params=None):
     """Generate cache file path from endpoint and params."""
-    params = params or {}
-    raw = f"{endpoint}|{json.dumps(params, sort_keys=True)}"
-    key = hashlib.sha256(raw.encode()).hexdigest()[:16]
-    return DEFAULT_CACHE_DIR / f"{key}.json"
+    return DEFAULT_CACHE_DIR / f"{_cache_key(endpoint, params)}.json"
 
 
 _api_cache = Cachetta(path=_api_cache_path, duration=DEFAULT_DURATION)
@@ -51,6 +50,7 @@ class GenericGitHubClient:
                 "Accept": "application/vnd.github+json",
             },
             timeout=30.0,
+            http2=True,
         )
         self._last_request_time = 0.0
         self._min_interval = 1.0 / REQUESTS_PER_SECOND
@@ -63,7 +63,13 @@ class GenericGitHubClient:
         def _do_fetch(endpoint, params=None):
             ep = endpoint if endpoint.startswith("/") else f"/{endpoint}"
             url = f"{API_BASE}{ep}"
-            resp = self._client.request("GET", url, params=params)
+            with read_cache(revalidate_cache, endpoint, params) as prior:
+                etag = prior.get("etag") if prior else None
+            headers = {"If-None-Match": etag} if etag else None
+            resp = self._client.request("GET", url, params=params, headers=headers)
+
+            if resp.status_code == 304 and prior:
+                return prior
 
             if resp.status_code == 429 or (
                 resp.status_code == 403 and "rate limit" in resp.text.lower()
@@ -77,7 +83,7 @@ class GenericGitHubClient:
             if 200 <= resp.status_code < 300:
                 return {
                     "status": resp.status_code,
-                    "body": resp.json() if resp.content else {},
+                    "body": orjson.loads(resp.content) if resp.content else {},
                     "etag": resp.headers.get("etag"),
                     "link": resp.headers.get("link"),
                 }
@@ -92,16 +98,14 @@ class GenericGitHubClient:
         # Configure cache with custom dir if needed
         if cache_dir != DEFAULT_CACHE_DIR:
             def _custom_path(endpoint, params=None):
-                params = params or {}
-                raw = f"{endpoint}|{json.dumps(params, sort_keys=True)}"
-                key = hashlib.sha256(raw.encode()).hexdigest()[:16]
-                return Path(cache_dir) / f"{key}.json"
+                return Path(cache_dir) / f"{_cache_key(endpoint, params)}.json"
 
             cache = Cachetta(path=_custom_path, duration=DEFAULT_DURATION)
             cache_skip_read = cache.copy(read=False)
         else:
             cache = _api_cache
             cache_skip_read = _api_cache_skip_read
+        revalidate_cache = cache.copy(read=True, duration=REVALIDATE_DURATION)
 
         self._cached_fetch = cache(_do_fetch)
         self._skip_read_fetch = cache_skip_read(_do_fetch)
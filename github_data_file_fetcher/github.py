@@ -5,6 +5,8 @@ import json
 import threading
 import time
 from datetime import timedelta
+from functools import lru_cache
+from json.encoder import encode_basestring_ascii
 from pathlib import Path
 
 from cachetta import Cachetta, read_cache, write_cache
@@ -14,6 +16,10 @@ from .settings import get_settings
 
 DEFAULT_CACHE_DIR = Path.home() / ".cache/github-data-file-fetcher"
 DEFAULT_DURATION = timedelta(days=30)
+# Error entries (not_found, no_content, ...) expire sooner: files get created and fixed
+NEGATIVE_DURATION = timedelta(days=1)
+# Per-repo set of "ref:path" strings known not to exist, one entry per repo
+_MISSING_ENDPOINT = "contents_missing"
 
 # Rate limit backoff settings
 BACKOFF_FACTOR = 1.5
@@ -24,12 +30,69 @@ MAX_RETRIES = 30
 REQUESTS_PER_SECOND = 1.3
 
 
+# Param shapes of the pipeline endpoints, keys pre-sorted as json.dumps(sort_keys=True) orders them
+_KEY_SCHEMAS = {
+    endpoint: (frozenset(keys), keys)
+    for endpoint, keys in {
+        "contents": ("owner", "path", "ref", "repo"),
+        "file_history": ("owner", "path", "repo"),
+        "repo_metadata": ("repo_key",),
+        "search/code": ("page", "per_page", "q"),
+    }.items()
+}
+_SCALAR_ENCODERS = {
+    str: encode_basestring_ascii,
+    int: int.__repr__,
+    type(None): lambda _: "null",
+}
+
+
+def _params_json(endpoint: str, params: dict) -> str:
+    """Serialize params exactly as json.dumps(params, sort_keys=True) would.
+
+    Known endpoint shapes with scalar values are encoded field by field in
+    schema order, skipping the sort and the generic encoder.
+    """
+    schema = _KEY_SCHEMAS.get(endpoint)
+    if schema is not None and params.keys() == schema[0]:
+        parts = []
+        for name in schema[1]:
+            encode = _SCALAR_ENCODERS.get(type(params[name]))
+            if encode is None:
+                break
+            parts.append(f'"{name}": {encode(params[name])}')
+        else:
+            return "{" + ", ".join(parts) + "}"
+    return json.dumps(params, sort_keys=True)
+
+
+def _hash_key(endpoint: str, params: dict) -> str:
+    raw = f"{endpoint}|{_params_json(endpoint, params)}"
+    return hashlib.sha256(raw.encode()).hexdigest()[:16]
+
+
+@lru_cache(maxsize=4096)
+def _frozen_cache_key(endpoint: str, items: tuple) -> str:
+    return _hash_key(endpoint, {name: value for name, _, value in items})
+
+
+def _cache_key(endpoint: str, params: dict | None = None) -> str:
+    """Generate the cache key for an endpoint and params.
+
+    Hashable params are memoized; value types are part of the memo key so
+    1 and True (equal, but serialized differently) never share an entry.
+    """
+    params = params or {}
+    items = tuple(sorted((name, type(value), value) for name, value in params.items()))
+    try:
+        return _frozen_cache_key(endpoint, items)
+    except TypeError:  # unhashable values (lists, dicts)
+        return _hash_key(endpoint, params)
+
+
 def _cache_path(endpoint, params=None):
     """Generate cache file path from endpoint and params."""
-    params = params or {}
-    raw = f"{endpoint}|{json.dumps(params, sort_keys=True)}"
-    key = hashlib.sha256(raw.encode()).hexdigest()[:16]
-    return DEFAULT_CACHE_DIR / f"{key}.json"
+    return DEFAULT_CACHE_DIR / f"{_cache_key(endpoint, params)}.json"
 
 
 _default_cache = Cachetta(path=_cache_path, duration=DEFAULT_DURATION)
@@ -38,34 +101,87 @@ _default_cache = Cachetta(path=_cache_path, duration=DEFAULT_DURATION)
 class Cache:
     """Cachetta-backed file cache for API responses."""
 
-    def __init__(self, cache_dir: Path, skip_cache: bool = False):
+    def __init__(
+        self, cache_dir: Path, skip_cache: bool = False,
+        negative_duration: timedelta = NEGATIVE_DURATION,
+    ):
         self.cache_dir = cache_dir
         self.skip_cache = skip_cache
+        self.negative_duration = negative_duration
         self.hits = 0
+        self._hits_lock = threading.Lock()
+        self._missing_lock = threading.Lock()
         if cache_dir != DEFAULT_CACHE_DIR:
             def _custom_path(endpoint, params=None):
-                params = params or {}
-                raw = f"{endpoint}|{json.dumps(params, sort_keys=True)}"
-                key = hashlib.sha256(raw.encode()).hexdigest()[:16]
-                return cache_dir / f"{key}.json"
+                return cache_dir / f"{_cache_key(endpoint, params)}.json"
             self._cache = Cachetta(path=_custom_path, duration=DEFAULT_DURATION, read=not skip_cache)
         else:
             if skip_cache:
                 self._cache = _default_cache.copy(read=False)
             else:
                 self._cache = _default_cache
+        # Reads regardless of skip_cache, for merging into entries rather than replacing them
+        self._merge_reader = self._cache.copy(read=True) if skip_cache else self._cache
 
     def _key(self, endpoint: str, params: dict) -> str:
         """Generate cache key for an API call."""
-        raw = f"{endpoint}|{json.dumps(params, sort_keys=True)}"
-        return hashlib.sha256(raw.encode()).hexdigest()[:16]
+        return _cache_key(endpoint, params)
+
+    def get_missing_set(self, owner: str, repo: str) -> set[str]:
+        """Return the "ref:path" strings known to be missing from a repo.
+
+        Not counted in hits: callers count the items they answer from the set.
+        """
+        return set(self._missing_paths(owner, repo, self._cache))
+
+    def _missing_paths(self, owner: str, repo: str, cache: Cachetta) -> dict[str, float]:
+        """Return unexpired "ref:path" -> time recorded for a repo's missing set."""
+        with read_cache(cache, _MISSING_ENDPOINT, {"owner": owner, "repo": repo}) as data:
+            if not data:
+                return {}
+        cutoff = time.time() - self.negative_duration.total_seconds()
+        return {ref_path: t for ref_path, t in data["paths"].items() if t >= cutoff}
+
+    def add_missing(self, owner: str, repo: str, ref_paths: list[str]):
+        """Record "ref:path" strings in the repo's missing set.
+
+        The set only saves reads: callers also write each path's own not_found
+        entry, so paths lost to a concurrent writer in another process are still
+        answered from cache.
+        """
+        with self._missing_lock:
+            paths = self._missing_paths(owner, repo, self._merge_reader)
+            now = time.time()
+            for ref_path in ref_paths:
+                paths[ref_path] = now
+            self.set(_MISSING_ENDPOINT, {"owner": owner, "repo": repo}, {
+                "error": "not_found",
+                "paths": paths,
+            })
 
     def get(self, endpoint: str, params: dict) -> dict | None:
-        """Get cached API response."""
+        """Get cached API response; error entries expire after negative_duration."""
         with read_cache(self._cache, endpoint, params) as data:
-            if data is not None:
-                self.hits += 1
-            return data
+            if data is not None and "error" in data and self._is_stale_negative(
+                self._key(endpoint, params)
+            ):
+                data = None
+        if data is not None:
+            self.add_hits(1)
+        return data
+
+    def add_hits(self, n: int):
+        """Count n lookups answered from cache; safe to call from worker threads."""
+        with self._hits_lock:
+            self.hits += n
+
+    def _is_stale_negative(self, key: str) -> bool:
+        """True if the entry for key was written more than negative_duration ago."""
+        try:
+            mtime = (self.cache_dir / f"{key}.json").stat().st_mtime
+        except FileNotFoundError:
+            return False
+        return time.time() - mtime > self.negative_duration.total_seconds()
 
     def set(self, endpoint: str, params: dict, data: dict):
         """Cache an API response."""
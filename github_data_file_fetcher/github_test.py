@@ -1,5 +1,7 @@
 """Unit tests for GitHub client."""
 
+import os
+import time
 from pathlib import Path
 from unittest.mock import MagicMock, patch
 
@@ -36,6 +38,54 @@ def describe_GitHubClient():
 
             assert client.cache.cache_dir.exists()
 
+        def it_expires_error_entries_after_negative_duration(client: GitHubClient):
+            client.cache.set("contents", {"path": "gone"}, {"error": "not_found"})
+            client.cache.set("contents", {"path": "kept"}, {"content": "abc"})
+            two_days_ago = time.time() - 2 * 86400
+            for path in ("gone", "kept"):
+                entry = client.cache.cache_dir / f"{client.cache._key('contents', {'path': path})}.json"
+                os.utime(entry, (two_days_ago, two_days_ago))
+
+            assert client.cache.get("contents", {"path": "gone"}) is None
+            assert client.cache.get("contents", {"path": "kept"}) == {"content": "abc"}
+
+        def it_accepts_a_custom_negative_duration(tmp_path: Path):
+            from datetime import timedelta
+
+            from .github import Cache
+            cache = Cache(tmp_path / ".neg", negative_duration=timedelta(days=7))
+            cache.set("contents", {"path": "gone"}, {"error": "not_found"})
+            cache.add_missing("o", "r", ["main:a.py"])
+            two_days_ago = time.time() - 2 * 86400
+            entry = cache.cache_dir / f"{cache._key('contents', {'path': 'gone'})}.json"
+            os.utime(entry, (two_days_ago, two_days_ago))
+
+            assert cache.get("contents", {"path": "gone"}) == {"error": "not_found"}
+            with patch("github_data_file_fetcher.github.time.time", return_value=time.time() + 2 * 86400):
+                assert cache.get_missing_set("o", "r") == {"main:a.py"}
+
+        def it_merges_missing_paths_per_repo(client: GitHubClient):
+            client.cache.add_missing("o", "r", ["main:a.py"])
+            client.cache.add_missing("o", "r", ["main:b.py"])
+
+            assert client.cache.get_missing_set("o", "r") == {"main:a.py", "main:b.py"}
+            assert client.cache.get_missing_set("o", "other") == set()
+
+        def it_merges_missing_paths_with_skip_cache(tmp_path: Path):
+            from .github import Cache
+            Cache(tmp_path / ".miss").add_missing("o", "r", ["main:a.py"])
+
+            Cache(tmp_path / ".miss", skip_cache=True).add_missing("o", "r", ["main:b.py"])
+
+            assert Cache(tmp_path / ".miss").get_missing_set("o", "r") == {"main:a.py", "main:b.py"}
+
+        def it_does_not_count_missing_set_reads_as_hits(client: GitHubClient):
+            client.cache.add_missing("o", "r", ["main:a.py"])
+            client.cache.add_missing("o", "r", ["main:b.py"])
+            client.cache.get_missing_set("o", "r")
+
+            assert client.cache.hits == 0
+
         def it_generates_different_keys_for_different_params(client: GitHubClient):
             key1 = client.cache._key("search/code", {"q": "foo"})
             key2 = client.cache._key("search/code", {"q": "bar"})
@@ -369,3 +419,30 @@ def describe_GitHubClient():
             k1 = client.cache._key("search/code", {"q": "t"})
             k2 = client.cache._key("contents", {"q": "t"})
             assert k1 != k2
+
+        @pytest.mark.parametrize("endpoint,params", [
+            ("search/code", {"q": 'filename:"SKILL.md" size:0..10', "per_page": 100, "page": 2}),
+            ("contents", {"owner": "o", "repo": "r", "path": "dir/ünïcode.md", "ref": None}),
+            ("file_history", {"owner": "o", "repo": "r", "path": "a\\b.md"}),
+            ("repo_metadata", {"repo_key": "o/r"}),
+            ("search/code", {"q": "t", "per_page": True, "page": 1.5}),
+            ("contents", {"owner": "o", "repo": "r"}),
+        ])
+        def it_serializes_known_endpoints_like_json_dumps(endpoint, params):
+            import json
+
+            from .github import _params_json
+            assert _params_json(endpoint, params) == json.dumps(params, sort_keys=True)
+
+        @pytest.mark.parametrize("params", [
+            {"page": 1}, {"page": True}, {"page": 1.0}, {"b": 2, "a": 1}, {"labels": ["x", "y"]},
+        ])
+        def it_memoizes_without_changing_the_key(params):
+            import hashlib
+            import json
+
+            from .github import _cache_key
+            raw = f"ep|{json.dumps(params, sort_keys=True)}"
+            expected = hashlib.sha256(raw.encode()).hexdigest()[:16]
+            assert _cache_key("ep", params) == expected
+            assert _cache_key("ep", dict(params)) == expected
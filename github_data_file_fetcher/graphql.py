@@ -3,16 +3,24 @@
 import base64
 import hashlib
 import json
+import random
 import sys
+import threading
 import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
-from datetime import timedelta
+from datetime import datetime, timedelta
+from functools import lru_cache
+from itertools import islice
+from json.encoder import encode_basestring_ascii
 from pathlib import Path
 
 import httpx
+import orjson
 from cachetta import Cachetta
 
-from .github import DEFAULT_CACHE_DIR, Cache
+from .github import DEFAULT_CACHE_DIR, NEGATIVE_DURATION, Cache
 from .settings import get_settings
 
 GRAPHQL_URL = "https://api.github.com/graphql"
@@ -20,17 +28,41 @@ GRAPHQL_URL = "https://api.github.com/graphql"
 # GraphQL rate limit: 5,000 points/hour, secondary limit ~2,000 points/minute
 # Each query costs ~1 point. 30/sec = 1,800/min, safely under secondary limit.
 QUERIES_PER_SECOND = 30
+# Queries kept in flight by map_batches. At ~200ms per round trip a single
+# caller manages ~5 QPS, so overlapping requests is what reaches the throttle.
+MAX_CONCURRENT_QUERIES = 8
+# Keep a connection warm for every query map_batches may have in flight
+HTTP_LIMITS = httpx.Limits(max_keepalive_connections=MAX_CONCURRENT_QUERIES, keepalive_expiry=60.0)
+# Below this many remaining points, _throttle spreads the rest of the budget
+# evenly over the time left until x-ratelimit-reset instead of running into 429s.
+RATE_LIMIT_RESERVE = 200
+# fetch_batch splits larger batches into several queries to stay under
+# GitHub's per-query node and complexity limits.
+MAX_FILES_PER_QUERY = 200
+MAX_QUERY_BYTES = 500_000
 MAX_RETRIES = 10
 BACKOFF_FACTOR = 2
 DEFAULT_DURATION = timedelta(days=30)
 
 
+def _graphql_cache_key(query: str, variables: dict | None = None) -> str:
+    """Generate the cache key for a query and variables.
+
+    Equivalent to hashing f"graphql|{json.dumps({"query": ..., "variables": ...},
+    sort_keys=True)}", but streams the pieces into the hasher so the (often
+    large) query is escaped once and never copied into a combined string.
+    """
+    h = hashlib.sha256(b'graphql|{"query": ')
+    h.update(encode_basestring_ascii(query).encode())
+    h.update(b', "variables": ')
+    h.update(json.dumps(variables or {}, sort_keys=True).encode())
+    h.update(b"}")
+    return h.hexdigest()[:16]
+
+
 def _graphql_cache_path(query, variables=None):
     """Generate cache file path from query and variables."""
-    params = {"query": query, "variables": variables or {}}
-    raw = f"graphql|{json.dumps(params, sort_keys=True)}"
-    key = hashlib.sha256(raw.encode()).hexdigest()[:16]
-    return DEFAULT_CACHE_DIR / f"{key}.json"
+    return DEFAULT_CACHE_DIR / f"{_graphql_cache_key(query, variables)}.json"
 
 
 _graphql_cache = Cachetta(path=_graphql_cache_path, duration=DEFAULT_DURATION)
@@ -42,7 +74,7 @@ class _GraphQLErrorOnly(Exception):
         self.body = body
 
 
-@dataclass
+@dataclass(slots=True)
 class FileResult:
     owner: str
     repo: str
@@ -52,14 +84,14 @@ class FileResult:
     error: str | None = None
 
 
-@dataclass
+@dataclass(slots=True)
 class MetadataResult:
     repo_key: str
     metadata: dict | None = None
     error: str | None = None
 
 
-@dataclass
+@dataclass(slots=True)
 class HistoryResult:
     owner: str
     repo: str
@@ -68,69 +100,159 @@ class HistoryResult:
     error: str | None = None
 
 
+# Fixed selection sets the builders append after each per-item header line
+_BLOB_SELECTION = (
+    "{\n"
+    "      ... on Blob { text byteSize isTruncated }\n"
+    "    }\n"
+)
+_METADATA_SELECTION = (
+    "{\n"
+    "    stargazerCount\n"
+    "    forkCount\n"
+    "    watchers { totalCount }\n"
+    "    primaryLanguage { name }\n"
+    "    repositoryTopics(first: 20) { nodes { topic { name } } }\n"
+    "    createdAt\n"
+    "    updatedAt\n"
+    "    pushedAt\n"
+    "    defaultBranchRef { name }\n"
+    "    licenseInfo { spdxId }\n"
+    "    description\n"
+    "  }\n"
+)
+_HISTORY_SELECTION = (
+    "{\n"
+    "          nodes { oid messageHeadline committedDate author { name } }\n"
+    "        }\n"
+)
+# (metadata key, GraphQL field, extractor for nested values) in REST metadata order
+_METADATA_FIELDS = (
+    ("stars", "stargazerCount", None),
+    ("forks", "forkCount", None),
+    ("watchers", "watchers", lambda v: (v or {}).get("totalCount")),
+    ("language", "primaryLanguage", lambda v: (v or {}).get("name")),
+    ("topics", "repositoryTopics",
+     lambda v: [n["topic"]["name"] for n in (v or {}).get("nodes", []) if n.get("topic")]),
+    ("created_at", "createdAt", None),
+    ("updated_at", "updatedAt", None),
+    ("pushed_at", "pushedAt", None),
+    ("default_branch", "defaultBranchRef", lambda v: (v or {}).get("name")),
+    ("license", "licenseInfo", lambda v: (v or {}).get("spdxId")),
+    ("description", "description", None),
+)
+# Appended to every batch query so each response reports its cost and the remaining budget
+_RATE_LIMIT_FIELD = "  rateLimit { cost remaining resetAt }\n"
+
+
+# Precomputed aliases; batches rarely exceed this many repos, refs or files
+_ALIAS_TABLE_SIZE = 1024
+_REPO_ALIASES = tuple(f"r{i}" for i in range(_ALIAS_TABLE_SIZE))
+_REF_ALIASES = tuple(f"ref{i}" for i in range(_ALIAS_TABLE_SIZE))
+_FILE_ALIASES = tuple(f"f{i}" for i in range(_ALIAS_TABLE_SIZE))
+
+
 def _make_alias(index: int) -> str:
-    return f"r{index}"
+    return _REPO_ALIASES[index] if index < _ALIAS_TABLE_SIZE else f"r{index}"
+
+
+def _ref_alias(index: int) -> str:
+    return _REF_ALIASES[index] if index < _ALIAS_TABLE_SIZE else f"ref{index}"
+
+
+def _file_alias(index: int) -> str:
+    return _FILE_ALIASES[index] if index < _ALIAS_TABLE_SIZE else f"f{index}"
 
 
+_GRAPHQL_ESCAPES = str.maketrans({"\\": "\\\\", '"': '\\"'})
+
+
+@lru_cache(maxsize=8192)
 def _escape_graphql_string(s: str) -> str:
     """Escape a string for use inside GraphQL double-quoted strings."""
-    return s.replace("\\", "\\\\").replace('"', '\\"')
+    if "\\" not in s and '"' not in s:
+        return s
+    return s.translate(_GRAPHQL_ESCAPES)
+
 
+def _group_by_repo(
+    items: list[tuple[str, str, str, str]],
+) -> dict[tuple[str, str], list[tuple[int, str, str]]]:
+    """Group (owner, repo, ref, path) items by (owner, repo) -> list of (index, ref, path).
 
-def _build_query(items: list[tuple[str, str, str, str]]) -> str:
+    Groups keep first-seen order, which fixes the repo alias numbering.
+    """
+    repo_groups: dict[tuple[str, str], list[tuple[int, str, str]]] = {}
+    for i, (owner, repo, ref, path) in enumerate(items):
+        repo_groups.setdefault((owner, repo), []).append((i, ref, path))
+    return repo_groups
+
+
+def _build_query(
+    items: list[tuple[str, str, str, str]],
+) -> tuple[str, dict[int, tuple[str, str]]]:
     """Build a batched GraphQL query.
 
     Each item is (owner, repo, ref, path).
     Groups items by (owner, repo) to avoid duplicate repository lookups,
     then creates per-file object lookups within each repo alias.
+    Returns the query and a map of item index -> (repo_alias, file_alias).
     """
-    # Group by (owner, repo) -> list of (index, ref, path)
-    repo_groups: dict[tuple[str, str], list[tuple[int, str, str]]] = {}
-    for i, (owner, repo, ref, path) in enumerate(items):
-        key = (owner, repo)
-        if key not in repo_groups:
-            repo_groups[key] = []
-        repo_groups[key].append((i, ref, path))
-
-    parts = []
+    repo_groups = _group_by_repo(items)
+    out = ["query {\n"]
+    aliases: dict[int, tuple[str, str]] = {}
     for repo_idx, ((owner, repo), file_list) in enumerate(repo_groups.items()):
-        file_parts = []
-        for item_idx, ref, path in file_list:
-            expression = _escape_graphql_string(f"{ref}:{path}")
-            file_parts.append(
-                f'    f{item_idx}: object(expression: "{expression}") {{\n'
-                f"      ... on Blob {{ text byteSize isTruncated }}\n"
-                f"    }}"
-            )
-        files_block = "\n".join(file_parts)
-        owner_esc = _escape_graphql_string(owner)
-        repo_esc = _escape_graphql_string(repo)
-        parts.append(
-            f'  {_make_alias(repo_idx)}: repository(owner: "{owner_esc}", name: "{repo_esc}") {{\n'
-            f"{files_block}\n"
-            f"  }}"
+        repo_alias = _make_alias(repo_idx)
+        out.append(
+            f'  {repo_alias}: repository(owner: "{_escape_graphql_string(owner)}", '
+            f'name: "{_escape_graphql_string(repo)}") {{\n'
         )
-
-    return "query {\n" + "\n".join(parts) + "\n}"
+        for item_idx, ref, path in file_list:
+            file_alias = _file_alias(item_idx)
+            aliases[item_idx] = (repo_alias, file_alias)
+            out.append(f'    {file_alias}: object(expression: "{_escape_graphql_string(f"{ref}:{path}")}") ')
+            out.append(_BLOB_SELECTION)
+        out.append("  }\n")
+    out.append(_RATE_LIMIT_FIELD)
+    out.append("}")
+    return "".join(out), aliases
 
 
 class GraphQLClient:
     """GitHub GraphQL client for batched file content fetching."""
 
-    def __init__(self, cache_dir=None, skip_cache=False):
-        self.cache = Cache(cache_dir or DEFAULT_CACHE_DIR, skip_cache=skip_cache)
+    def __init__(
+        self, cache_dir=None, skip_cache=False, http_client: httpx.Client | None = None,
+        negative_duration: timedelta = NEGATIVE_DURATION,
+    ):
+        """Create a client.
+
+        Pass http_client to share one connection pool between several
+        GraphQLClients (e.g. a session-scoped client in tests); it is not
+        closed by close(). negative_duration is how long not_found/bad_ref
+        results are served from cache before being re-queried.
+        """
+        self.cache = Cache(
+            cache_dir or DEFAULT_CACHE_DIR, skip_cache=skip_cache, negative_duration=negative_duration,
+        )
         self._settings = get_settings()
         if not self._settings.github_token:
             raise RuntimeError("GITHUB_TOKEN is not set")
-        self._client = httpx.Client(
-            headers={
-                "Authorization": f"bearer {self._settings.github_token}",
-                "Content-Type": "application/json",
-            },
-            timeout=30.0,
-        )
+        # Sent per request so a shared http_client needs no GitHub-specific setup
+        self._headers = {
+            "Authorization": f"bearer {self._settings.github_token}",
+            "Content-Type": "application/json",
+        }
+        self._owns_client = http_client is None
+        self._client = http_client or httpx.Client(timeout=30.0, http2=True, limits=HTTP_LIMITS)
+        self._throttle_lock = threading.Lock()
         self._last_query_time = 0.0
         self._min_interval = 1.0 / QUERIES_PER_SECOND
+        self._rl_remaining: int | None = None
+        self._rl_reset: int | None = None
+        self.last_query_cost: int | None = None
+        self._inflight: dict[tuple[str, str], Future] = {}
+        self._inflight_lock = threading.Lock()
         self.queries = 0
         self.rate_limit_hits = 0
         self.retries = 0
@@ -141,13 +263,13 @@ class GraphQLClient:
         cache_dir = cache_dir or DEFAULT_CACHE_DIR
         if cache_dir != DEFAULT_CACHE_DIR:
             def _custom_path(query, variables=None):
-                params = {"query": query, "variables": variables or {}}
-                raw = f"graphql|{json.dumps(params, sort_keys=True)}"
-                key = hashlib.sha256(raw.encode()).hexdigest()[:16]
-                return Path(cache_dir) / f"{key}.json"
+                return Path(cache_dir) / f"{_graphql_cache_key(query, variables)}.json"
             gql_cache = Cachetta(path=_custom_path, duration=DEFAULT_DURATION)
         else:
             gql_cache = _graphql_cache
+        if skip_cache:
+            # Same as Cache: skip reads, still write the fresh response
+            gql_cache = gql_cache.copy(read=False)
 
         def _do_graphql(query, variables=None):
             body = self._execute_query(query, variables)
@@ -160,11 +282,54 @@ class GraphQLClient:
         self._raw_graphql = _do_graphql
 
     def _throttle(self):
-        now = time.time()
-        elapsed = now - self._last_query_time
-        if elapsed < self._min_interval:
-            time.sleep(self._min_interval - elapsed)
-        self._last_query_time = time.time()
+        """Reserve the next query slot under the lock, then sleep until it outside the lock."""
+        with self._throttle_lock:
+            now = time.time()
+            interval = self._min_interval
+            remaining, reset = self._rl_remaining, self._rl_reset
+            if remaining is not None and reset is not None and remaining < RATE_LIMIT_RESERVE:
+                window = reset - now
+                if window > 0:
+                    interval = max(interval, window / max(remaining, 1))
+            start = max(now, self._last_query_time + interval)
+            self._last_query_time = start
+        if start > now:
+            time.sleep(start - now)
+
+    def _tally(
+        self, elapsed: float = 0.0, queries: int = 0, retries: int = 0, rate_limit_hits: int = 0,
+    ):
+        """Add to the query stats; map_batches workers update them concurrently."""
+        with self._throttle_lock:
+            self.total_query_time += elapsed
+            self.queries += queries
+            self.retries += retries
+            self.rate_limit_hits += rate_limit_hits
+
+    def _record_rate_limit(self, resp: httpx.Response):
+        """Remember the budget GitHub reports so _throttle can slow down early."""
+        remaining = _parse_int_header(resp, "x-ratelimit-remaining")
+        reset = _parse_int_header(resp, "x-ratelimit-reset")
+        if remaining is None or reset is None:
+            return
+        with self._throttle_lock:
+            self._rl_remaining = remaining
+            self._rl_reset = reset
+
+    def _record_rate_limit_body(self, body: dict):
+        """Update the budget from the rateLimit block the batch queries request."""
+        rate_limit = (body.get("data") or {}).get("rateLimit")
+        if not rate_limit:
+            return
+        try:
+            reset = int(datetime.fromisoformat(rate_limit["resetAt"]).timestamp())
+            remaining = int(rate_limit["remaining"])
+        except (KeyError, TypeError, ValueError):
+            return
+        with self._throttle_lock:
+            self._rl_remaining = remaining
+            self._rl_reset = reset
+            self.last_query_cost = rate_limit.get("cost")
 
     def _log(self, msg: str):
         """Log a message above the progress line."""
@@ -189,52 +354,49 @@ class GraphQLClient:
             if variables is not None:
                 payload["variables"] = variables
             try:
-                resp = self._client.post(GRAPHQL_URL, json=payload)
+                resp = self._client.post(GRAPHQL_URL, content=orjson.dumps(payload), headers=self._headers)
             except (httpx.RemoteProtocolError, httpx.ReadError, httpx.ConnectError) as exc:
-                elapsed = time.time() - t0
-                self.total_query_time += elapsed
-                self.queries += 1
-                self.retries += 1
-                wait = BACKOFF_FACTOR ** attempt
-                self._log(f"{type(exc).__name__}: {exc}, retry {attempt + 1}/{MAX_RETRIES} (wait {wait}s)")
+                self._tally(elapsed=time.time() - t0, queries=1, retries=1)
+                wait = _backoff(attempt)
+                self._log(f"{type(exc).__name__}: {exc}, retry {attempt + 1}/{MAX_RETRIES} (wait {wait:.1f}s)")
                 time.sleep(wait)
                 continue
-            elapsed = time.time() - t0
-            self.total_query_time += elapsed
-            self.queries += 1
+            self._tally(elapsed=time.time() - t0, queries=1)
+            self._record_rate_limit(resp)
 
             if resp.status_code == 200:
-                body = resp.json()
+                body = orjson.loads(resp.content)
+                self._record_rate_limit_body(body)
                 # GraphQL can return 200 with errors
                 if "errors" in body and not body.get("data"):
                     for err in body["errors"]:
                         if err.get("type") == "RATE_LIMITED":
-                            self.rate_limit_hits += 1
-                            wait = _parse_retry_after(resp) or (BACKOFF_FACTOR ** attempt * 5)
+                            self._tally(rate_limit_hits=1)
+                            wait = _rate_limit_wait(resp, attempt)
                             self._log(f"RATE LIMITED (200 body), waiting {wait:.0f}s")
                             time.sleep(wait)
                             break
                     else:
-                        self.retries += 1
+                        self._tally(retries=1)
                         err_types = [e.get("type", "unknown") for e in body.get("errors", [])]
                         self._log(f"GraphQL errors (no data): {err_types}, retry {attempt + 1}/{MAX_RETRIES}")
                         if attempt < MAX_RETRIES - 1:
-                            time.sleep(BACKOFF_FACTOR ** attempt)
+                            time.sleep(_backoff(attempt))
                             continue
                         return body
                 return body
 
             if resp.status_code in (429, 403):
-                self.rate_limit_hits += 1
-                wait = _parse_retry_after(resp) or (BACKOFF_FACTOR ** attempt * 5)
+                self._tally(rate_limit_hits=1)
+                wait = _rate_limit_wait(resp, attempt)
                 self._log(f"HTTP {resp.status_code}, waiting {wait:.0f}s (attempt {attempt + 1})")
                 time.sleep(wait)
                 continue
 
             if resp.status_code >= 500:
-                self.retries += 1
+                self._tally(retries=1)
                 self._log(f"HTTP {resp.status_code}, retry {attempt + 1}/{MAX_RETRIES}")
-                time.sleep(BACKOFF_FACTOR ** attempt)
+                time.sleep(_backoff(attempt))
                 continue
 
             # Other client errors -- don't retry
@@ -247,11 +409,31 @@ class GraphQLClient:
 
         Returns the full parsed JSON response body.
         Only successful responses (containing "data") are cached via Cachetta.
+        Concurrent calls with the same query and variables share one request.
         """
+        key = (query, json.dumps(variables, sort_keys=True))
+        with self._inflight_lock:
+            fut = self._inflight.get(key)
+            leader = fut is None
+            if leader:
+                fut = self._inflight[key] = Future()
+        if not leader:
+            return fut.result()
+
         try:
-            return self._cached_graphql(query, variables)
-        except _GraphQLErrorOnly as e:
-            return e.body
+            try:
+                body = self._cached_graphql(query, variables)
+            except _GraphQLErrorOnly as e:
+                body = e.body
+        except BaseException as exc:
+            fut.set_exception(exc)
+            raise
+        else:
+            fut.set_result(body)
+            return body
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
 
     def fetch_batch(
         self, items: list[tuple[str, str, str, str]]
@@ -262,68 +444,78 @@ class GraphQLClient:
         Returns a FileResult for each item in the same order.
 
         Cache-compatible with REST: uses same Cache key format and base64-encodes content.
+        Missing files get the same per-path not_found entry REST writes, and are also
+        added to the repo's missing set so a later batch answers them with one read.
         Truncated blobs are NOT cached (they need REST fallback).
         """
-        results: list[FileResult] = []
+        results: list[FileResult | None] = [None] * len(items)
         uncached_indices: list[int] = []
         uncached_items: list[tuple[str, str, str, str]] = []
 
-        # Phase 1: Check cache for each item
+        # Phase 1: Check each repo's missing set, then the cache for the remaining items
+        missing = {
+            key: self.cache.get_missing_set(*key)
+            for key in {(owner, repo) for owner, repo, _ref, _path in items}
+        }
         for i, (owner, repo, ref, path) in enumerate(items):
+            if f"{ref}:{path}" in missing[(owner, repo)]:
+                self.cache.add_hits(1)
+                results[i] = FileResult(owner, repo, path, ref, error="not_found")
+                continue
             cache_params = {"owner": owner, "repo": repo, "path": path, "ref": ref}
             cached = self.cache.get("contents", cache_params)
             if cached is not None:
                 if cached.get("error"):
-                    results.append(FileResult(owner, repo, path, ref, error=cached["error"]))
+                    results[i] = FileResult(owner, repo, path, ref, error=cached["error"])
                 elif cached.get("content"):
-                    results.append(FileResult(owner, repo, path, ref, content_b64=cached["content"]))
+                    results[i] = FileResult(owner, repo, path, ref, content_b64=cached["content"])
                 else:
-                    results.append(FileResult(owner, repo, path, ref, error="no_content"))
+                    results[i] = FileResult(owner, repo, path, ref, error="no_content")
             else:
-                results.append(None)  # placeholder
                 uncached_indices.append(i)
-                uncached_items.append((owner, repo, ref, path))
+                uncached_items.append(items[i])
 
         if not uncached_items:
             return results
 
-        # Phase 2: Build and execute GraphQL query
-        query = _build_query(uncached_items)
-        body = self._execute_query(query)
+        # Phase 2: Query uncached items, split so no single query grows too large.
+        # Chunks run one after another: callers already fan batches out via map_batches.
+        fetched = [
+            result
+            for i in range(0, len(uncached_items), MAX_FILES_PER_QUERY)
+            for result in self._fetch_contents(uncached_items[i : i + MAX_FILES_PER_QUERY])
+        ]
+        for item_idx, result in zip(uncached_indices, fetched, strict=True):
+            results[item_idx] = result
+        return results
+
+    def _fetch_contents(self, items: list[tuple[str, str, str, str]]) -> list[FileResult]:
+        """Query file contents for uncached items and cache the results.
+
+        Halves the batch until the UTF-8 encoded query fits in MAX_QUERY_BYTES.
+        """
+        query, aliases = _build_query(items)
+        if len(query.encode()) > MAX_QUERY_BYTES and len(items) > 1:
+            mid = len(items) // 2
+            return self._fetch_contents(items[:mid]) + self._fetch_contents(items[mid:])
 
+        body = self._execute_query(query)
         data = body.get("data") or {}
 
-        # Build reverse map: (owner, repo) -> repo_alias
-        repo_groups: dict[tuple[str, str], str] = {}
-        repo_idx = 0
-        seen = {}
-        for owner, repo, _ref, _path in uncached_items:
-            key = (owner, repo)
-            if key not in seen:
-                seen[key] = _make_alias(repo_idx)
-                repo_idx += 1
-            repo_groups[(owner, repo)] = seen[key]
-
-        # Phase 3: Map results back
-        # file aliases in the query use the index within uncached_items (from _build_query's enumerate)
-        for list_pos, item_idx in enumerate(uncached_indices):
-            owner, repo, ref, path = uncached_items[list_pos]
+        # Phase 3: Map results back and cache
+        results: list[FileResult] = []
+        not_found: dict[tuple[str, str], list[str]] = {}
+        for list_pos, (owner, repo, ref, path) in enumerate(items):
             cache_params = {"owner": owner, "repo": repo, "path": path, "ref": ref}
-            repo_alias = repo_groups[(owner, repo)]
-            file_alias = f"f{list_pos}"
+            repo_alias, file_alias = aliases[list_pos]
 
             repo_data = data.get(repo_alias)
-            if repo_data is None:
-                # Repository not found or access denied
-                self.cache.set("contents", cache_params, {"error": "not_found"})
-                results[item_idx] = FileResult(owner, repo, path, ref, error="not_found")
-                continue
-
-            blob = repo_data.get(file_alias)
+            # None: repository not found or access denied, or file not found at that ref:path
+            blob = repo_data.get(file_alias) if repo_data is not None else None
             if blob is None:
-                # File not found at that ref:path
                 self.cache.set("contents", cache_params, {"error": "not_found"})
-                results[item_idx] = FileResult(owner, repo, path, ref, error="not_found")
+                not_found.setdefault((owner, repo), []).append(f"{ref}:{path}")
+                results.append(FileResult(owner, repo, path, ref, error="not_found"))
                 continue
 
             text = blob.get("text")
@@ -332,13 +524,13 @@ class GraphQLClient:
 
             if is_truncated:
                 # Don't cache -- caller should fall back to REST
-                results[item_idx] = FileResult(owner, repo, path, ref, error="truncated")
+                results.append(FileResult(owner, repo, path, ref, error="truncated"))
                 continue
 
             if text is None:
                 # Binary file or empty
                 self.cache.set("contents", cache_params, {"error": "no_content"})
-                results[item_idx] = FileResult(owner, repo, path, ref, error="no_content")
+                results.append(FileResult(owner, repo, path, ref, error="no_content"))
                 continue
 
             # Encode to base64 to match REST cache format
@@ -349,8 +541,10 @@ class GraphQLClient:
                 "size": byte_size,
                 "path": path,
             })
-            results[item_idx] = FileResult(owner, repo, path, ref, content_b64=content_b64)
+            results.append(FileResult(owner, repo, path, ref, content_b64=content_b64))
 
+        for (owner, repo), ref_paths in not_found.items():
+            self.cache.add_missing(owner, repo, ref_paths)
         return results
 
     def fetch_metadata_batch(self, repo_keys: list[str]) -> list[MetadataResult]:
@@ -394,21 +588,9 @@ class GraphQLClient:
                 results[item_idx] = MetadataResult(repo_key, error="not_found")
                 continue
 
-            topics_nodes = repo_data.get("repositoryTopics", {}).get("nodes", [])
-            topics = [n["topic"]["name"] for n in topics_nodes if n.get("topic")]
-
             metadata = {
-                "stars": repo_data.get("stargazerCount"),
-                "forks": repo_data.get("forkCount"),
-                "watchers": (repo_data.get("watchers") or {}).get("totalCount"),
-                "language": (repo_data.get("primaryLanguage") or {}).get("name"),
-                "topics": topics,
-                "created_at": repo_data.get("createdAt"),
-                "updated_at": repo_data.get("updatedAt"),
-                "pushed_at": repo_data.get("pushedAt"),
-                "default_branch": (repo_data.get("defaultBranchRef") or {}).get("name"),
-                "license": (repo_data.get("licenseInfo") or {}).get("spdxId"),
-                "description": repo_data.get("description"),
+                key: extract(repo_data.get(field)) if extract else repo_data.get(field)
+                for key, field, extract in _METADATA_FIELDS
             }
             self.cache.set("repo_metadata", cache_params, metadata)
             results[item_idx] = MetadataResult(repo_key, metadata=metadata)
@@ -428,8 +610,7 @@ class GraphQLClient:
         uncached_items: list[tuple[str, str, str, str]] = []
 
         for i, (owner, repo, ref, path) in enumerate(items):
-            cache_params = {"owner": owner, "repo": repo, "path": path}
-            cached = self.cache.get("file_history", cache_params)
+            cached = self.cache.get("file_history", {"owner": owner, "repo": repo, "path": path})
             if cached is not None:
                 if cached.get("error"):
                     results.append(HistoryResult(owner, repo, path, error=cached["error"]))
@@ -443,50 +624,14 @@ class GraphQLClient:
         if not uncached_items:
             return results
 
-        query = _build_history_query(uncached_items)
+        query, aliases = _build_history_query(uncached_items)
         body = self._execute_query(query)
         data = body.get("data") or {}
 
-        # Build same grouping as the query builder to map aliases back
-        repo_groups: dict[tuple[str, str], list[tuple[int, str, str]]] = {}
-        for i, (owner, repo, ref, path) in enumerate(uncached_items):
-            key = (owner, repo)
-            if key not in repo_groups:
-                repo_groups[key] = []
-            repo_groups[key].append((i, ref, path))
-
-        # Build alias maps
-        repo_alias_map: dict[tuple[str, str], str] = {}
-        ref_alias_map: dict[tuple[str, str, str], str] = {}
-        file_alias_map: dict[int, str] = {}  # uncached index -> file alias
-
-        repo_idx = 0
-        for (owner, repo), file_list in repo_groups.items():
-            repo_alias_map[(owner, repo)] = _make_alias(repo_idx)
-            # Group by ref within this repo
-            ref_groups: dict[str, list[tuple[int, str]]] = {}
-            for item_idx, ref, path in file_list:
-                if ref not in ref_groups:
-                    ref_groups[ref] = []
-                ref_groups[ref].append((item_idx, path))
-            for ref_idx, (ref, files) in enumerate(ref_groups.items()):
-                ref_alias = f"ref{ref_idx}"
-                ref_alias_map[(owner, repo, ref)] = ref_alias
-                for file_idx, (item_idx, path) in enumerate(files):
-                    file_alias_map[item_idx] = (repo_idx, ref_alias, f"f{file_idx}")
-            repo_idx += 1
-
         for list_pos, item_idx in enumerate(uncached_indices):
             owner, repo, ref, path = uncached_items[list_pos]
             cache_params = {"owner": owner, "repo": repo, "path": path}
-
-            alias_info = file_alias_map.get(list_pos)
-            if alias_info is None:
-                results[item_idx] = HistoryResult(owner, repo, path, error="mapping_error")
-                continue
-
-            r_idx, ref_alias, f_alias = alias_info
-            repo_alias = _make_alias(r_idx)
+            repo_alias, ref_alias, f_alias = aliases[list_pos]
             repo_data = data.get(repo_alias)
 
             if repo_data is None:
@@ -521,88 +666,118 @@ class GraphQLClient:
 
         return results
 
+    def map_batches(self, fetch, batches, max_workers: int = MAX_CONCURRENT_QUERIES):
+        """Run a fetch_*_batch method over many batches with several queries in flight.
+
+        Yields each batch's results in input order. All workers share this
+        client's throttle, so the overall rate stays under QUERIES_PER_SECOND.
+        At most 2 * max_workers batches are submitted ahead of the one being
+        yielded, so results finished while an earlier batch sits in retry
+        backoff don't pile up in memory. Closing the generator (or Ctrl-C)
+        cancels the rest without waiting on workers asleep in a backoff.
+        """
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        batches = iter(batches)
+        wait = True
+        try:
+            window = deque(executor.submit(fetch, b) for b in islice(batches, 2 * max_workers))
+            while window:
+                results = window.popleft().result()
+                for batch in islice(batches, 1):
+                    window.append(executor.submit(fetch, batch))
+                yield results
+        except (GeneratorExit, KeyboardInterrupt):
+            wait = False
+            raise
+        finally:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
     def close(self):
-        self._client.close()
+        if self._owns_client:
+            self._client.close()
 
 
 def _build_metadata_query(repo_keys: list[str]) -> str:
     """Build a batched GraphQL query for repository metadata."""
-    parts = []
+    out = ["query {\n"]
     for i, repo_key in enumerate(repo_keys):
         owner, repo = repo_key.split("/", 1)
-        owner_esc = _escape_graphql_string(owner)
-        repo_esc = _escape_graphql_string(repo)
-        parts.append(
-            f'  {_make_alias(i)}: repository(owner: "{owner_esc}", name: "{repo_esc}") {{\n'
-            f"    stargazerCount\n"
-            f"    forkCount\n"
-            f"    watchers {{ totalCount }}\n"
-            f"    primaryLanguage {{ name }}\n"
-            f"    repositoryTopics(first: 20) {{ nodes {{ topic {{ name }} }} }}\n"
-            f"    createdAt\n"
-            f"    updatedAt\n"
-            f"    pushedAt\n"
-            f"    defaultBranchRef {{ name }}\n"
-            f"    licenseInfo {{ spdxId }}\n"
-            f"    description\n"
-            f"  }}"
+        out.append(
+            f'  {_make_alias(i)}: repository(owner: "{_escape_graphql_string(owner)}", '
+            f'name: "{_escape_graphql_string(repo)}") '
         )
-    return "query {\n" + "\n".join(parts) + "\n}"
+        out.append(_METADATA_SELECTION)
+    out.append(_RATE_LIMIT_FIELD)
+    out.append("}")
+    return "".join(out)
 
 
-def _build_history_query(items: list[tuple[str, str, str, str]]) -> str:
+def _build_history_query(
+    items: list[tuple[str, str, str, str]],
+) -> tuple[str, dict[int, tuple[str, str, str]]]:
     """Build a batched GraphQL query for file commit history.
 
     Each item is (owner, repo, ref, path).
     Groups by (owner, repo) then by ref to minimize aliases.
+    Returns the query and a map of item index -> (repo_alias, ref_alias, file_alias).
     """
-    # Group by (owner, repo) -> list of (index, ref, path)
-    repo_groups: dict[tuple[str, str], list[tuple[int, str, str]]] = {}
-    for i, (owner, repo, ref, path) in enumerate(items):
-        key = (owner, repo)
-        if key not in repo_groups:
-            repo_groups[key] = []
-        repo_groups[key].append((i, ref, path))
-
-    parts = []
+    repo_groups = _group_by_repo(items)
+    out = ["query {\n"]
+    aliases: dict[int, tuple[str, str, str]] = {}
     for repo_idx, ((owner, repo), file_list) in enumerate(repo_groups.items()):
         # Group by ref within this repo
         ref_groups: dict[str, list[tuple[int, str]]] = {}
         for item_idx, ref, path in file_list:
-            if ref not in ref_groups:
-                ref_groups[ref] = []
-            ref_groups[ref].append((item_idx, path))
+            ref_groups.setdefault(ref, []).append((item_idx, path))
 
-        ref_parts = []
+        repo_alias = _make_alias(repo_idx)
+        out.append(
+            f'  {repo_alias}: repository(owner: "{_escape_graphql_string(owner)}", '
+            f'name: "{_escape_graphql_string(repo)}") {{\n'
+        )
         for ref_idx, (ref, files) in enumerate(ref_groups.items()):
-            file_parts = []
-            for file_idx, (item_idx, path) in enumerate(files):
-                path_esc = _escape_graphql_string(path)
-                file_parts.append(
-                    f'        f{file_idx}: history(first: 100, path: "{path_esc}") {{\n'
-                    f"          nodes {{ oid messageHeadline committedDate author {{ name }} }}\n"
-                    f"        }}"
-                )
-            files_block = "\n".join(file_parts)
-            ref_esc = _escape_graphql_string(ref)
-            ref_parts.append(
-                f'    ref{ref_idx}: object(expression: "{ref_esc}") {{\n'
-                f"      ... on Commit {{\n"
-                f"{files_block}\n"
-                f"      }}\n"
-                f"    }}"
+            ref_alias = _ref_alias(ref_idx)
+            out.append(
+                f'    {ref_alias}: object(expression: "{_escape_graphql_string(ref)}") {{\n'
+                "      ... on Commit {\n"
             )
+            for file_idx, (item_idx, path) in enumerate(files):
+                file_alias = _file_alias(file_idx)
+                aliases[item_idx] = (repo_alias, ref_alias, file_alias)
+                out.append(f'        {file_alias}: history(first: 100, path: "{_escape_graphql_string(path)}") ')
+                out.append(_HISTORY_SELECTION)
+            out.append("      }\n    }\n")
+        out.append("  }\n")
+    out.append(_RATE_LIMIT_FIELD)
+    out.append("}")
+    return "".join(out), aliases
+
+
+def _backoff(attempt: int) -> float:
+    """Jittered exponential backoff for transient errors.
+
+    Randomizing the wait keeps concurrent workers that failed together from
+    retrying in lockstep.
+    """
+    base = BACKOFF_FACTOR ** attempt
+    return random.uniform(0.5 * base, base)
+
+
+def _rate_limit_wait(resp: httpx.Response, attempt: int) -> float:
+    """Wait before retrying a rate-limited query: Retry-After if given, else 5x backoff plus jitter."""
+    base = BACKOFF_FACTOR ** attempt
+    return _parse_retry_after(resp) or base * 5 + random.uniform(0, base)
 
-        refs_block = "\n".join(ref_parts)
-        owner_esc = _escape_graphql_string(owner)
-        repo_esc = _escape_graphql_string(repo)
-        parts.append(
-            f'  {_make_alias(repo_idx)}: repository(owner: "{owner_esc}", name: "{repo_esc}") {{\n'
-            f"{refs_block}\n"
-            f"  }}"
-        )
 
-    return "query {\n" + "\n".join(parts) + "\n}"
+def _parse_int_header(resp: httpx.Response, name: str) -> int | None:
+    """Parse an integer header (e.g. x-ratelimit-remaining) if present."""
+    val = resp.headers.get(name)
+    if val is None:
+        return None
+    try:
+        return int(val)
+    except (TypeError, ValueError):
+        return None
 
 
 def _parse_retry_after(resp: httpx.Response) -> float | None:
@@ -1,18 +1,26 @@
 """Unit tests for graphql module."""
 
+import hashlib
+import json
+import threading
+import time
 from pathlib import Path
 from unittest.mock import MagicMock, patch
 
 import pytest
 
 from .graphql import (
+    FileResult,
     GraphQLClient,
+    _backoff,
     _build_history_query,
     _build_metadata_query,
     _build_query,
     _escape_graphql_string,
+    _graphql_cache_key,
     _make_alias,
     _parse_retry_after,
+    _rate_limit_wait,
 )
 
 
@@ -24,6 +32,10 @@ def describe_escape_graphql_string():
     def it_escapes_quotes():
         assert _escape_graphql_string('a"b') == 'a\\"b'
 
+    def it_leaves_plain_strings_alone():
+        assert _escape_graphql_string("octocat") == "octocat"
+        assert _escape_graphql_string("main:src/a-b_c.py") == "main:src/a-b_c.py"
+
     def it_handles_combined():
         assert _escape_graphql_string('a\\"b') == 'a\\\\\\"b'
 
@@ -41,12 +53,15 @@ def describe_make_alias():
         assert _make_alias(5) == "r5"
         assert _make_alias(99) == "r99"
 
+    def it_formats_aliases_past_the_precomputed_table():
+        assert _make_alias(5000) == "r5000"
+
 
 def describe_build_query():
 
     def it_builds_single_item():
         items = [("owner", "repo", "main", "file.py")]
-        query = _build_query(items)
+        query, _ = _build_query(items)
         assert "repository" in query
         assert "owner" in query
         assert "repo" in query
@@ -58,7 +73,7 @@ def describe_build_query():
             ("owner", "repo", "main", "a.py"),
             ("owner", "repo", "main", "b.py"),
         ]
-        query = _build_query(items)
+        query, _ = _build_query(items)
         # Should have one repository block with two file aliases
         assert query.count("repository(") == 1
         assert "f0:" in query
@@ -69,14 +84,23 @@ def describe_build_query():
             ("alice", "r1", "main", "a.py"),
             ("bob", "r2", "main", "b.py"),
         ]
-        query = _build_query(items)
+        query, _ = _build_query(items)
         assert query.count("repository(") == 2
 
     def it_escapes_special_characters_in_paths():
         items = [("o", "r", "main", 'path/with"quote.py')]
-        query = _build_query(items)
+        query, _ = _build_query(items)
         assert '\\"' in query
 
+    def it_returns_alias_map_for_each_item():
+        items = [
+            ("alice", "r1", "main", "a.py"),
+            ("bob", "r2", "main", "b.py"),
+            ("alice", "r1", "dev", "c.py"),
+        ]
+        _, aliases = _build_query(items)
+        assert aliases == {0: ("r0", "f0"), 1: ("r1", "f1"), 2: ("r0", "f2")}
+
 
 def describe_build_metadata_query():
 
@@ -87,6 +111,10 @@ def describe_build_metadata_query():
         assert "owner" in query
         assert "repo" in query
 
+    def it_requests_rate_limit_info():
+        query = _build_metadata_query(["owner/repo"])
+        assert "rateLimit { cost remaining resetAt }" in query
+
     def it_builds_for_multiple_repos():
         query = _build_metadata_query(["a/r1", "b/r2", "c/r3"])
         assert query.count("repository(") == 3
@@ -99,7 +127,7 @@ def describe_build_history_query():
 
     def it_builds_single_item():
         items = [("owner", "repo", "main", "file.py")]
-        query = _build_history_query(items)
+        query, _ = _build_history_query(items)
         assert "repository(" in query
         assert "history(" in query
         assert "oid" in query
@@ -110,12 +138,27 @@ def describe_build_history_query():
             ("owner", "repo", "main", "b.py"),
             ("owner", "repo", "dev", "c.py"),
         ]
-        query = _build_history_query(items)
+        query, _ = _build_history_query(items)
         # One repo, two ref blocks
         assert query.count("repository(") == 1
         assert "ref0:" in query
         assert "ref1:" in query
 
+    def it_returns_alias_map_for_each_item():
+        items = [
+            ("owner", "repo", "main", "a.py"),
+            ("other", "repo", "main", "b.py"),
+            ("owner", "repo", "dev", "c.py"),
+            ("owner", "repo", "main", "d.py"),
+        ]
+        _, aliases = _build_history_query(items)
+        assert aliases == {
+            0: ("r0", "ref0", "f0"),
+            1: ("r1", "ref0", "f0"),
+            2: ("r0", "ref1", "f0"),
+            3: ("r0", "ref0", "f1"),
+        }
+
 
 def describe_parse_retry_after():
 
@@ -140,6 +183,40 @@ def describe_parse_retry_after():
         assert _parse_retry_after(resp) is None
 
 
+def describe_graphql_cache_key():
+
+    @pytest.mark.parametrize("query,variables", [
+        ("query { viewer { login } }", None),
+        ('query { repository(owner: "o", name: "r") { id } }', {}),
+        ("query($n: String!) { x }", {"n": "caf\u00e9", "a": [1, 2]}),
+        ("query {\n  \u00fcber\t\"q\"\\ }", {"b": {"z": 1, "y": None}}),
+    ])
+    def it_matches_the_json_dumps_key_format(query, variables):
+        params = {"query": query, "variables": variables or {}}
+        raw = f"graphql|{json.dumps(params, sort_keys=True)}"
+        assert _graphql_cache_key(query, variables) == hashlib.sha256(raw.encode()).hexdigest()[:16]
+
+
+def describe_backoff():
+
+    def it_jitters_within_half_to_full_base():
+        waits = [_backoff(3) for _ in range(50)]
+        assert all(4 <= w <= 8 for w in waits)
+        assert len(set(waits)) > 1
+
+    def it_prefers_retry_after_for_rate_limits():
+        resp = MagicMock()
+        resp.headers = {"retry-after": "7"}
+        assert _rate_limit_wait(resp, 4) == 7.0
+
+    def it_jitters_rate_limit_wait_without_retry_after():
+        resp = MagicMock()
+        resp.headers = {}
+        waits = [_rate_limit_wait(resp, 1) for _ in range(50)]
+        assert all(10 <= w <= 12 for w in waits)
+        assert len(set(waits)) > 1
+
+
 def describe_GraphQLClient():
 
     @pytest.fixture
@@ -149,6 +226,21 @@ def describe_GraphQLClient():
             client = GraphQLClient(cache_dir=tmp_path / "cache")
         return client
 
+    def it_uses_a_shared_http_client_without_closing_it(tmp_path):
+        shared = MagicMock()
+        shared.post.return_value.status_code = 200
+        shared.post.return_value.headers = {}
+        shared.post.return_value.content = json.dumps({"data": {}}).encode()
+        with patch("github_data_file_fetcher.graphql.get_settings") as ms:
+            ms.return_value = MagicMock(github_token="fake-token")
+            client = GraphQLClient(cache_dir=tmp_path / "cache", http_client=shared)
+
+        client._execute_query("query { viewer { login } }")
+        client.close()
+
+        assert shared.post.call_args[1]["headers"]["Authorization"] == "bearer fake-token"
+        shared.close.assert_not_called()
+
     def it_tracks_query_stats(gql):
         assert gql.queries == 0
         assert gql.rate_limit_hits == 0
@@ -193,13 +285,13 @@ def describe_GraphQLClient():
         """fetch_batch: uncached items hit API and get mapped correctly."""
         mock_resp = MagicMock()
         mock_resp.status_code = 200
-        mock_resp.json.return_value = {
+        mock_resp.content = json.dumps({
             "data": {
                 "r0": {
                     "f0": {"text": "hello world", "byteSize": 11, "isTruncated": False},
                 }
             }
-        }
+        }).encode()
         gql._client = MagicMock()
         gql._client.post.return_value = mock_resp
 
@@ -214,7 +306,7 @@ def describe_GraphQLClient():
     def it_handles_not_found_repos(gql):
         mock_resp = MagicMock()
         mock_resp.status_code = 200
-        mock_resp.json.return_value = {"data": {"r0": None}}
+        mock_resp.content = json.dumps({"data": {"r0": None}}).encode()
         gql._client = MagicMock()
         gql._client.post.return_value = mock_resp
 
@@ -224,19 +316,113 @@ def describe_GraphQLClient():
     def it_handles_not_found_files(gql):
         mock_resp = MagicMock()
         mock_resp.status_code = 200
-        mock_resp.json.return_value = {"data": {"r0": {"f0": None}}}
+        mock_resp.content = json.dumps({"data": {"r0": {"f0": None}}}).encode()
+        gql._client = MagicMock()
+        gql._client.post.return_value = mock_resp
+
+        results = gql.fetch_batch([("o", "r", "main", "missing.py")])
+        assert results[0].error == "not_found"
+
+    def it_writes_the_rest_not_found_entry_for_missing_files(gql):
+        mock_resp = MagicMock()
+        mock_resp.status_code = 200
+        mock_resp.content = json.dumps({"data": {"r0": {"f0": None}}}).encode()
         gql._client = MagicMock()
         gql._client.post.return_value = mock_resp
 
+        gql.fetch_batch([("o", "r", "main", "missing.py")])
+
+        params = {"owner": "o", "repo": "r", "path": "missing.py", "ref": "main"}
+        assert gql.cache.get("contents", params) == {"error": "not_found"}
+
+    def it_serves_known_missing_files_from_the_repo_missing_set(gql):
+        mock_resp = MagicMock()
+        mock_resp.status_code = 200
+        mock_resp.content = json.dumps({"data": {"r0": {"f0": None}}}).encode()
+        gql._client = MagicMock()
+        gql._client.post.return_value = mock_resp
+        gql.fetch_batch([("o", "r", "main", "missing.py")])
+
+        assert gql.cache.get_missing_set("o", "r") == {"main:missing.py"}
         results = gql.fetch_batch([("o", "r", "main", "missing.py")])
+
         assert results[0].error == "not_found"
+        assert gql._client.post.call_count == 1
+
+    def it_counts_one_hit_per_item_served_from_the_missing_set(gql):
+        gql.cache.add_missing("o", "r", ["main:a.py", "main:b.py"])
+        gql._client = MagicMock()
+
+        gql.fetch_batch([("o", "r", "main", "a.py"), ("o", "r", "main", "b.py")])
+
+        assert gql.cache.hits == 2
+        gql._client.post.assert_not_called()
+
+    def it_splits_batches_over_the_per_query_file_limit(gql):
+        mock_resp = MagicMock()
+        mock_resp.status_code = 200
+        mock_resp.content = json.dumps({"data": {}}).encode()
+        gql._client = MagicMock()
+        gql._client.post.return_value = mock_resp
+        items = [("o", "r", "main", f"{i}.py") for i in range(5)]
+
+        with patch("github_data_file_fetcher.graphql.MAX_FILES_PER_QUERY", 2):
+            results = gql.fetch_batch(items)
+
+        assert gql._client.post.call_count == 3
+        assert [r.path for r in results] == [f"{i}.py" for i in range(5)]
+
+    def it_queries_split_chunks_on_the_calling_thread(gql):
+        callers = set()
+
+        def fake_fetch(items):
+            callers.add(threading.get_ident())
+            return [FileResult(o, r, p, ref, error="not_found") for o, r, ref, p in items]
+
+        items = [("o", "r", "main", f"{i}.py") for i in range(5)]
+        with (
+            patch("github_data_file_fetcher.graphql.MAX_FILES_PER_QUERY", 2),
+            patch.object(gql, "_fetch_contents", side_effect=fake_fetch),
+        ):
+            gql.fetch_batch(items)
+
+        assert callers == {threading.get_ident()}
+
+    def it_halves_batches_whose_query_is_too_large(gql):
+        mock_resp = MagicMock()
+        mock_resp.status_code = 200
+        mock_resp.content = json.dumps({"data": {}}).encode()
+        gql._client = MagicMock()
+        gql._client.post.return_value = mock_resp
+        items = [("o", "r", "main", f"{i}.py") for i in range(4)]
+
+        with patch("github_data_file_fetcher.graphql.MAX_QUERY_BYTES", 250):
+            results = gql.fetch_batch(items)
+
+        assert gql._client.post.call_count == 4
+        assert [r.path for r in results] == [f"{i}.py" for i in range(4)]
+
+    def it_measures_the_query_limit_in_bytes(gql):
+        mock_resp = MagicMock()
+        mock_resp.status_code = 200
+        mock_resp.content = json.dumps({"data": {}}).encode()
+        gql._client = MagicMock()
+        gql._client.post.return_value = mock_resp
+        items = [("o", "r", "main", "dossier/résumé.md"), ("o", "r", "main", "日本語.md")]
+        query, _aliases = _build_query(items)
+
+        # Fits when counted in characters, not in UTF-8 bytes
+        with patch("github_data_file_fetcher.graphql.MAX_QUERY_BYTES", len(query)):
+            gql.fetch_batch(items)
+
+        assert gql._client.post.call_count == 2
 
     def it_handles_binary_files(gql):
         mock_resp = MagicMock()
         mock_resp.status_code = 200
-        mock_resp.json.return_value = {
+        mock_resp.content = json.dumps({
             "data": {"r0": {"f0": {"text": None, "byteSize": 500, "isTruncated": False}}}
-        }
+        }).encode()
         gql._client = MagicMock()
         gql._client.post.return_value = mock_resp
 
@@ -246,7 +432,7 @@ def describe_GraphQLClient():
     def it_fetches_metadata_from_api(gql):
         mock_resp = MagicMock()
         mock_resp.status_code = 200
-        mock_resp.json.return_value = {
+        mock_resp.content = json.dumps({
             "data": {
                 "r0": {
                     "stargazerCount": 100,
@@ -262,7 +448,7 @@ def describe_GraphQLClient():
                     "description": "A repo",
                 }
             }
-        }
+        }).encode()
         gql._client = MagicMock()
         gql._client.post.return_value = mock_resp
 
@@ -272,10 +458,26 @@ def describe_GraphQLClient():
         assert results[0].metadata["language"] == "Python"
         assert results[0].metadata["topics"] == ["ai"]
 
+    def it_maps_null_metadata_fields_to_none(gql):
+        mock_resp = MagicMock()
+        mock_resp.status_code = 200
+        mock_resp.content = json.dumps({
+            "data": {"r0": {"primaryLanguage": None, "licenseInfo": None, "repositoryTopics": {"nodes": []}}}
+        }).encode()
+        gql._client = MagicMock()
+        gql._client.post.return_value = mock_resp
+
+        results = gql.fetch_metadata_batch(["owner/repo"])
+        assert results[0].metadata == {
+            "stars": None, "forks": None, "watchers": None, "language": None, "topics": [],
+            "created_at": None, "updated_at": None, "pushed_at": None,
+            "default_branch": None, "license": None, "description": None,
+        }
+
     def it_fetches_history_from_api(gql):
         mock_resp = MagicMock()
         mock_resp.status_code = 200
-        mock_resp.json.return_value = {
+        mock_resp.content = json.dumps({
             "data": {
                 "r0": {
                     "ref0": {
@@ -292,7 +494,7 @@ def describe_GraphQLClient():
                     }
                 }
             }
-        }
+        }).encode()
         gql._client = MagicMock()
         gql._client.post.return_value = mock_resp
 
@@ -306,7 +508,7 @@ def describe_GraphQLClient():
     def it_handles_metadata_not_found(gql):
         mock_resp = MagicMock()
         mock_resp.status_code = 200
-        mock_resp.json.return_value = {"data": {"r0": None}}
+        mock_resp.content = json.dumps({"data": {"r0": None}}).encode()
         gql._client = MagicMock()
         gql._client.post.return_value = mock_resp
 
@@ -316,7 +518,7 @@ def describe_GraphQLClient():
     def it_handles_history_not_found_repo(gql):
         mock_resp = MagicMock()
         mock_resp.status_code = 200
-        mock_resp.json.return_value = {"data": {"r0": None}}
+        mock_resp.content = json.dumps({"data": {"r0": None}}).encode()
         gql._client = MagicMock()
         gql._client.post.return_value = mock_resp
 
@@ -326,7 +528,7 @@ def describe_GraphQLClient():
     def it_handles_history_bad_ref(gql):
         mock_resp = MagicMock()
         mock_resp.status_code = 200
-        mock_resp.json.return_value = {"data": {"r0": {"ref0": None}}}
+        mock_resp.content = json.dumps({"data": {"r0": {"ref0": None}}}).encode()
         gql._client = MagicMock()
         gql._client.post.return_value = mock_resp
 
@@ -341,3 +543,222 @@ def describe_GraphQLClient():
         gql._start_time = gql._start_time - 10  # pretend 10s elapsed
         assert gql.avg_query_time == 0.5
         assert gql.queries_per_sec > 0
+
+    def describe_graphql_single_flight():
+
+        def it_shares_one_request_between_concurrent_identical_queries(gql):
+            started = threading.Event()
+            release = threading.Event()
+            mock_resp = MagicMock()
+            mock_resp.status_code = 200
+            mock_resp.content = json.dumps({"data": {"viewer": {"login": "me"}}}).encode()
+
+            def post(*args, **kwargs):
+                started.set()
+                release.wait(5)
+                return mock_resp
+
+            gql._client = MagicMock()
+            gql._client.post.side_effect = post
+            results = []
+
+            def call():
+                results.append(gql.graphql("query { viewer { login } }"))
+
+            first = threading.Thread(target=call)
+            first.start()
+            started.wait(5)
+            second = threading.Thread(target=call)
+            second.start()
+            time.sleep(0.05)
+            release.set()
+            first.join(5)
+            second.join(5)
+
+            assert gql._client.post.call_count == 1
+            assert results == [{"data": {"viewer": {"login": "me"}}}] * 2
+            assert gql._inflight == {}
+
+        def it_clears_inflight_entry_on_error(gql):
+            gql._client = MagicMock()
+            gql._client.post.side_effect = ValueError("boom")
+
+            with pytest.raises(ValueError):
+                gql.graphql("query { viewer { login } }")
+            assert gql._inflight == {}
+
+    def describe_graphql_skip_cache():
+
+        def it_refetches_cached_queries_when_skip_cache_is_set(tmp_path):
+            mock_resp = MagicMock()
+            mock_resp.status_code = 200
+            mock_resp.headers = {}
+            mock_resp.content = json.dumps({"data": {"viewer": {"login": "me"}}}).encode()
+            clients = []
+            for skip_cache in (False, True):
+                with patch("github_data_file_fetcher.graphql.get_settings") as ms:
+                    ms.return_value = MagicMock(github_token="fake-token")
+                    client = GraphQLClient(cache_dir=tmp_path / "cache", skip_cache=skip_cache)
+                client._client = MagicMock()
+                client._client.post.return_value = mock_resp
+                client.graphql("query { viewer { login } }")
+                clients.append(client)
+
+            assert [c._client.post.call_count for c in clients] == [1, 1]
+
+    def describe_rate_limit_headers():
+
+        def it_records_remaining_and_reset(gql):
+            mock_resp = MagicMock()
+            mock_resp.status_code = 200
+            mock_resp.headers = {"x-ratelimit-remaining": "4321", "x-ratelimit-reset": "1700000000"}
+            mock_resp.content = json.dumps({"data": {}}).encode()
+            gql._client = MagicMock()
+            gql._client.post.return_value = mock_resp
+
+            gql._execute_query("query { viewer { login } }")
+
+            assert gql._rl_remaining == 4321
+            assert gql._rl_reset == 1700000000
+
+        def it_records_budget_from_rate_limit_block(gql):
+            mock_resp = MagicMock()
+            mock_resp.status_code = 200
+            mock_resp.headers = {}
+            mock_resp.content = json.dumps({"data": {"rateLimit": {
+                "cost": 3, "remaining": 150, "resetAt": "2023-11-14T22:13:20Z",
+            }}}).encode()
+            gql._client = MagicMock()
+            gql._client.post.return_value = mock_resp
+
+            gql._execute_query(_build_metadata_query(["o/r"]))
+
+            assert gql._rl_remaining == 150
+            assert gql._rl_reset == 1700000000
+            assert gql.last_query_cost == 3
+
+        def it_spreads_remaining_budget_until_reset(gql):
+            gql._rl_remaining = 2
+            gql._rl_reset = int(time.time()) + 10
+            gql._last_query_time = time.time()
+
+            with patch("github_data_file_fetcher.graphql.time.sleep") as sleep:
+                gql._throttle()
+
+            (wait,), _ = sleep.call_args
+            assert wait > 3
+
+        def it_uses_normal_interval_with_plenty_of_budget(gql):
+            gql._rl_remaining = 4000
+            gql._rl_reset = int(time.time()) + 3600
+            gql._last_query_time = time.time()
+
+            with patch("github_data_file_fetcher.graphql.time.sleep") as sleep:
+                gql._throttle()
+
+            (wait,), _ = sleep.call_args
+            assert wait <= gql._min_interval
+
+        def it_reserves_successive_slots_for_concurrent_callers(gql):
+            gql._min_interval = 1.0
+            gql._last_query_time = time.time()
+
+            with patch("github_data_file_fetcher.graphql.time.sleep") as sleep:
+                gql._throttle()
+                gql._throttle()
+
+            waits = [call.args[0] for call in sleep.call_args_list]
+            assert 0.9 < waits[0] <= 1.0
+            assert 1.9 < waits[1] <= 2.0
+
+        def it_releases_the_lock_while_sleeping(gql):
+            gql._min_interval = 0.3
+            gql._last_query_time = time.time()
+            sleeper = threading.Thread(target=gql._throttle)
+            sleeper.start()
+            time.sleep(0.05)
+
+            acquired = gql._throttle_lock.acquire(timeout=0.1)
+            if acquired:
+                gql._throttle_lock.release()
+            sleeper.join()
+
+            assert acquired
+
+        def it_tallies_stats_from_concurrent_workers(gql):
+            def work():
+                for _ in range(1000):
+                    gql._tally(elapsed=0.001, queries=1, retries=1)
+
+            workers = [threading.Thread(target=work) for _ in range(4)]
+            for w in workers:
+                w.start()
+            for w in workers:
+                w.join()
+
+            assert gql.queries == 4000
+            assert gql.retries == 4000
+
+    def describe_map_batches():
+
+        def it_yields_results_in_batch_order(gql):
+            def fetch(batch):
+                time.sleep(0.01 * (3 - batch[0]))  # later batches finish first
+                return [n * 10 for n in batch]
+
+            results = list(gql.map_batches(fetch, [[0], [1], [2]]))
+
+            assert results == [[0], [10], [20]]
+
+        def it_keeps_several_batches_in_flight(gql):
+            in_flight = []
+            peak = []
+            lock = threading.Lock()
+
+            def fetch(batch):
+                with lock:
+                    in_flight.append(batch)
+                    peak.append(len(in_flight))
+                time.sleep(0.02)
+                with lock:
+                    in_flight.remove(batch)
+                return batch
+
+            list(gql.map_batches(fetch, [[i] for i in range(6)], max_workers=3))
+
+            assert max(peak) == 3
+
+        def it_submits_at_most_two_batches_per_worker_ahead(gql):
+            submitted = []
+            release = threading.Event()
+
+            def fetch(batch):
+                submitted.append(batch)
+                if batch == [0]:
+                    release.wait(1)  # first batch stuck in a retry backoff
+                return batch
+
+            results = gql.map_batches(fetch, [[i] for i in range(20)], max_workers=2)
+            threading.Timer(0.1, release.set).start()
+            assert next(results) == [0]
+
+            assert len(submitted) <= 5
+            assert list(results) == [[i] for i in range(1, 20)]
+
+        def it_does_not_wait_for_sleeping_workers_when_closed(gql):
+            release = threading.Event()
+
+            def fetch(batch):
+                if batch != [0]:
+                    release.wait(5)  # worker asleep in a backoff
+                return batch
+
+            results = gql.map_batches(fetch, [[i] for i in range(4)], max_workers=2)
+            assert next(results) == [0]
+
+            t0 = time.time()
+            results.close()
+            elapsed = time.time() - t0
+            release.set()
+
+            assert elapsed < 1
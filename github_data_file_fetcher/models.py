@@ -6,7 +6,7 @@ GITHUB_SEARCH_RESULT_LIMIT = 1000  # GitHub Code Search API hard limit per query
 MAX_FILE_CONTENT_LENGTH = 10_000  # Truncate files longer than this for classification
 
 
-@dataclass
+@dataclass(slots=True)
 class ApiResponse:
     """Response from the generic GitHub REST API client."""
 
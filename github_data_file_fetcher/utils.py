@@ -2,6 +2,7 @@
 
 import signal
 import sys
+from functools import lru_cache
 from pathlib import Path
 
 
@@ -29,7 +30,9 @@ def truncate_text(text: str, max_len: int = 120) -> str:
     """Truncate text to max length, breaking at word boundary."""
     if len(text) <= max_len:
         return text
-    return text[: max_len - 3].rsplit(" ", 1)[0] + "..."
+    end = max_len - 3
+    cut = text.rfind(" ", 0, end)
+    return text[: end if cut == -1 else cut] + "..."
 
 
 def escape_html(text: str) -> str:
@@ -57,6 +60,7 @@ def resolve_content_path(content_dir: "Path", owner: str, repo: str, ref: str, p
     return content_dir / owner / repo / "blob" / ref / path
 
 
+@lru_cache(maxsize=16384)
 def parse_github_url(url: str) -> tuple[str, str, str, str] | None:
     """Parse a GitHub blob URL into (owner, repo, ref, path).
 
@@ -65,13 +69,9 @@ def parse_github_url(url: str) -> tuple[str, str, str, str] | None:
     """
     if not url.startswith("https://github.com/"):
         return None
-    # Remove https://github.com/
-    rest = url[19:]
-    parts = rest.split("/")
+    # Remove https://github.com/ and split off the path in one pass
+    parts = url[19:].split("/", 4)
     if len(parts) < 5 or parts[2] != "blob":
         return None
-    owner = parts[0]
-    repo = parts[1]
-    ref = parts[3]
-    path = "/".join(parts[4:])
+    owner, repo, _blob, ref, path = parts
     return owner, repo, ref, path
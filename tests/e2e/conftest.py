@@ -1,23 +1,71 @@
 """E2E test fixtures: real API, isolated temp directories."""
 
+import io
 import os
+import signal
+import sqlite3
 import subprocess
+import traceback
+from contextlib import closing, contextmanager, redirect_stderr, redirect_stdout
+from pathlib import Path
 
 import pytest
 
+from github_data_file_fetcher import generic_client, github
+from github_data_file_fetcher.cli import main
 from github_data_file_fetcher.db import init_db
 
+REPO_ROOT = Path(__file__).resolve().parents[2]
+
+
+@contextmanager
+def _fresh_process_state():
+    """Give an in-process CLI run the state a new process would start with.
+
+    Clears the get_client/get_generic_client singletons (and their cache.hits
+    counters) so cold and cached runs are independent, and restores the test
+    process's SIGPIPE handler afterwards in case the CLI changed it.
+    """
+    sigpipe = signal.getsignal(signal.SIGPIPE)
+    github._clients.clear()
+    generic_client._generic_clients.clear()
+    try:
+        yield
+    finally:
+        for client in generic_client._generic_clients.values():
+            client.close()
+        generic_client._generic_clients.clear()
+        github._clients.clear()
+        signal.signal(signal.SIGPIPE, sigpipe)
+
 
 def _run_cli(*args, output_dir=None, timeout=300):
-    """Run the github-fetch CLI and return CompletedProcess."""
-    cmd = ["uv", "run", "github-fetch"]
+    """Run the github-fetch CLI and return CompletedProcess.
+
+    Runs main() in-process, skipping interpreter startup. Set E2E_SUBPROCESS=1
+    to spawn `uv run github-fetch` instead (timeout only applies then).
+    """
+    argv = []
     if output_dir:
-        cmd.extend(["--output-dir", str(output_dir)])
-    cmd.extend(args)
-    return subprocess.run(
-        cmd, capture_output=True, text=True, timeout=timeout,
-        cwd="/mnt/work/@work/github-data-file-fetcher",
-    )
+        argv.extend(["--output-dir", str(output_dir)])
+    argv.extend(args)
+    if os.environ.get("E2E_SUBPROCESS"):
+        return subprocess.run(
+            ["uv", "run", "github-fetch", *argv], capture_output=True, text=True, timeout=timeout,
+            cwd=REPO_ROOT,
+        )
+
+    stdout, stderr = io.StringIO(), io.StringIO()
+    returncode = 0
+    with _fresh_process_state(), redirect_stdout(stdout), redirect_stderr(stderr):
+        try:
+            main(argv)
+        except SystemExit as exc:
+            returncode = exc.code if isinstance(exc.code, int) else int(exc.code is not None)
+        except Exception:
+            traceback.print_exc()
+            returncode = 1
+    return subprocess.CompletedProcess(argv, returncode, stdout.getvalue(), stderr.getvalue())
 
 
 @pytest.fixture
@@ -52,14 +100,25 @@ def e2e_output_dir(tmp_path):
     return d
 
 
-@pytest.fixture
-def populated_small_db(e2e_output_dir):
-    """DB populated with <100 files from a small query. Shared fixture for content/metadata/history tests."""
-    db_path = e2e_output_dir / "files.db"
+@pytest.fixture(scope="session")
+def small_db_template(tmp_path_factory):
+    """DB populated with <100 files from a small query, fetched once per session."""
+    output_dir = tmp_path_factory.mktemp("populated_small_db")
+    db_path = output_dir / "files.db"
     result = _run_cli(
         "fetch-file-paths", "filename:CLAUDE.md repo:anthropics/courses",
         "--db", str(db_path),
-        output_dir=e2e_output_dir,
+        output_dir=output_dir,
     )
     assert result.returncode == 0, f"fetch-file-paths failed:\n{result.stdout}\n{result.stderr}"
     return db_path
+
+
+@pytest.fixture
+def populated_small_db(small_db_template, e2e_output_dir):
+    """Per-test copy of the session's small DB. Shared fixture for content/metadata/history tests."""
+    db_path = e2e_output_dir / "files.db"
+    # backup() rather than a file copy so rows still in the WAL are included
+    with closing(sqlite3.connect(small_db_template)) as src, closing(sqlite3.connect(db_path)) as dst:
+        src.backup(dst)
+    return db_path
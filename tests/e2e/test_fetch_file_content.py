@@ -5,25 +5,20 @@ Skip if GITHUB_TOKEN is not set.
 """
 
 import os
-import subprocess
 
 import pytest
 
-pytestmark = pytest.mark.skipif(
-    not os.environ.get("GITHUB_TOKEN"),
-    reason="GITHUB_TOKEN required for E2E tests",
-)
+from .conftest import _run_cli
 
-
-def _run_cli(*args, output_dir=None, timeout=300):
-    cmd = ["uv", "run", "github-fetch"]
-    if output_dir:
-        cmd.extend(["--output-dir", str(output_dir)])
-    cmd.extend(args)
-    return subprocess.run(
-        cmd, capture_output=True, text=True, timeout=timeout,
-        cwd="/mnt/work/@work/github-data-file-fetcher",
-    )
+pytestmark = [
+    pytest.mark.skipif(
+        not os.environ.get("GITHUB_TOKEN"),
+        reason="GITHUB_TOKEN required for E2E tests",
+    ),
+    # One xdist worker for all e2e tests: they share the real API rate limit and the
+    # default cache, and the session's small DB is then fetched only once
+    pytest.mark.xdist_group("e2e"),
+]
 
 
 def test_cold_start(populated_small_db, e2e_output_dir):
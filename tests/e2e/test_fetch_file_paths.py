@@ -8,30 +8,25 @@ Tests two query sizes (<100 files, <1000 files) each cold and with cache.
 
 import os
 import sqlite3
-import subprocess
 
 import pytest
 
-pytestmark = pytest.mark.skipif(
-    not os.environ.get("GITHUB_TOKEN"),
-    reason="GITHUB_TOKEN required for E2E tests",
-)
+from .conftest import _run_cli
+
+pytestmark = [
+    pytest.mark.skipif(
+        not os.environ.get("GITHUB_TOKEN"),
+        reason="GITHUB_TOKEN required for E2E tests",
+    ),
+    # One xdist worker for all e2e tests: they share the real API rate limit and the
+    # default cache, and the session's small DB is then fetched only once
+    pytest.mark.xdist_group("e2e"),
+]
 
 SMALL_QUERY = "filename:CLAUDE.md repo:anthropics/courses"  # <100 files
 MEDIUM_QUERY = "filename:CLAUDE.md size:0..200"  # <1000 files
 
 
-def _run_cli(*args, output_dir=None, timeout=300):
-    cmd = ["uv", "run", "github-fetch"]
-    if output_dir:
-        cmd.extend(["--output-dir", str(output_dir)])
-    cmd.extend(args)
-    return subprocess.run(
-        cmd, capture_output=True, text=True, timeout=timeout,
-        cwd="/mnt/work/@work/github-data-file-fetcher",
-    )
-
-
 def test_small_cold_start(e2e_output_dir):
     """Cold start with <100 files populates the DB."""
     db_path = e2e_output_dir / "files.db"
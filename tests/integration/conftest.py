@@ -0,0 +1,74 @@
+"""Integration test fixtures: real SQLite and file cache in isolated temp directories."""
+
+import shutil
+import sqlite3
+
+import pytest
+
+from github_data_file_fetcher.db import init_db
+from github_data_file_fetcher.github import GitHubClient
+
+
+@pytest.fixture
+def fast_sqlite_pragmas(monkeypatch):
+    """Skip fsync on the test's connections; test DBs are thrown away.
+
+    Opt in per module with pytestmark = pytest.mark.usefixtures("fast_sqlite_pragmas").
+    """
+    connect = sqlite3.connect
+
+    def _connect(*args, **kwargs):
+        conn = connect(*args, **kwargs)
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    monkeypatch.setattr(sqlite3, "connect", _connect)
+
+
+@pytest.fixture(scope="session")
+def _db_template(tmp_path_factory):
+    """Schema-initialized DB, built once per session and copied per test."""
+    p = tmp_path_factory.mktemp("tpl") / "tpl.db"
+    init_db(p)
+    return p
+
+
+@pytest.fixture
+def db_path(tmp_path, _db_template):
+    """Per-test copy of the template DB."""
+    p = tmp_path / "test.db"
+    shutil.copyfile(_db_template, p)
+    return p
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    """Isolated cache directory (never ~/.cache)."""
+    d = tmp_path / "cache"
+    d.mkdir()
+    return d
+
+
+@pytest.fixture
+def client(cache_dir):
+    """Real GitHubClient on the isolated cache; tests swap in a mock _github."""
+    return GitHubClient(cache_dir=cache_dir)
+
+
+@pytest.fixture
+def query(db_path):
+    """Run a read-only query against the test DB, returning all rows.
+
+    One connection is opened on first use and shared for the rest of the test.
+    """
+    conns: list[sqlite3.Connection] = []
+
+    def _query(sql, *params):
+        if not conns:
+            conns.append(sqlite3.connect(f"file:{db_path}?mode=ro", uri=True))
+        return conns[0].execute(sql, params).fetchall()
+
+    yield _query
+    for conn in conns:
+        conn.close()
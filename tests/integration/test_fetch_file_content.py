@@ -3,22 +3,22 @@
 Real SQLite + real file-based Cache. Only external API calls (PyGithub/httpx) are mocked.
 """
 
-from pathlib import Path
+import base64
+import json
+import os
+import re
+import threading
 from unittest.mock import MagicMock, patch
 
 import pytest
 from github import GithubException
 
-from github_data_file_fetcher.db import init_db, insert_files
+from github_data_file_fetcher.db import insert_files
 from github_data_file_fetcher.fetch_file_content import fetch_file_content, fetch_file_content_graphql
-from github_data_file_fetcher.github import Cache, GitHubClient
+from github_data_file_fetcher.github import Cache
+from github_data_file_fetcher.graphql import FileResult, GraphQLClient
 
-
-@pytest.fixture
-def db_path(tmp_path):
-    p = tmp_path / "test.db"
-    init_db(p)
-    return p
+pytestmark = pytest.mark.usefixtures("fast_sqlite_pragmas")
 
 
 @pytest.fixture
@@ -29,15 +29,29 @@ def content_dir(tmp_path):
 
 
 @pytest.fixture
-def cache_dir(tmp_path):
-    d = tmp_path / "cache"
-    d.mkdir()
-    return d
+def mock_github_client():
+    """Patch get_client in fetch_file_content module to return a MagicMock."""
+    with patch("github_data_file_fetcher.fetch_file_content.fetch_file_content.get_client") as mock:
+        client = MagicMock()
+        mock.return_value = client
+        yield client
 
 
 @pytest.fixture
-def client(cache_dir):
-    return GitHubClient(cache_dir=cache_dir)
+def thread_errors(monkeypatch):
+    """Exceptions raised in background threads (e.g. the progress display) during the test."""
+    errors = []
+    monkeypatch.setattr(threading, "excepthook", lambda args: errors.append(args.exc_value))
+    return errors
+
+
+def _mock_gql():
+    """GraphQLClient stand-in with numeric stats, so the progress display can render."""
+    gql = MagicMock(
+        queries=0, avg_query_time=0.0, queries_per_sec=0.0, rate_limit_hits=0, retries=0,
+    )
+    gql.cache.hits = 0
+    return gql
 
 
 URLS = [
@@ -45,6 +59,9 @@ URLS = [
     "https://github.com/owner/repo/blob/dev/other/file.md",
 ]
 
+# Paths requested by a blob query: object(expression: "ref:path")
+_QUERY_PATH_RE = re.compile(r'expression: "[^":]*:([^"]+)"')
+
 
 def _setup_db(db_path, urls=URLS):
     insert_files(db_path, [{"html_url": u, "sha": "abc"} for u in urls])
@@ -52,54 +69,62 @@ def _setup_db(db_path, urls=URLS):
 
 def _create_content_on_disk(content_dir, urls):
     """Write placeholder files so skip logic triggers."""
+    root = str(content_dir)
+    paths = []
     for url in urls:
-        rest = url[19:]
-        parts = rest.split("/")
-        owner, repo, _, ref = parts[0], parts[1], parts[2], parts[3]
-        path = "/".join(parts[4:])
-        local = content_dir / owner / repo / "blob" / ref / path
-        local.parent.mkdir(parents=True, exist_ok=True)
-        local.write_text("# existing")
+        _, _, _, owner, repo, _, ref, path = url.split("/", 7)
+        paths.append(os.path.join(root, owner, repo, "blob", ref, path))
+    for parent in {os.path.dirname(local) for local in paths}:
+        os.makedirs(parent, exist_ok=True)
+    for local in paths:
+        with open(local, "wb") as f:
+            f.write(b"# existing")
+
+
+_GQL_TRUNCATED = json.dumps({
+    "data": {"r0": {"f0": {"text": "partial", "byteSize": 200000, "isTruncated": True}}}
+}).encode()
+
+
+def _gql_response(repos):
+    """GraphQL blob response: one r{i} alias per repo, one f{j} per file text."""
+    return {"data": {
+        f"r{i}": {
+            f"f{j}": {"text": text, "byteSize": len(text), "isTruncated": False}
+            for j, text in enumerate(texts)
+        }
+        for i, texts in enumerate(repos)
+    }}
 
 
 def describe_rest_fetch():
 
-    def it_fetches_content_for_urls(db_path, content_dir):
+    def it_fetches_content_for_urls(db_path, content_dir, mock_github_client):
         _setup_db(db_path)
 
-        with patch("github_data_file_fetcher.fetch_file_content.fetch_file_content.get_client") as mock:
-            client = MagicMock()
-            client.get_file_content.return_value = {"content": "IyBUZXN0IEZpbGU="}
-            mock.return_value = client
+        mock_github_client.get_file_content.return_value = {"content": "IyBUZXN0IEZpbGU="}
 
-            stats = fetch_file_content(URLS, content_dir)
+        stats = fetch_file_content(URLS, content_dir)
 
         assert stats["fetched"] == 2
         assert stats["errors"] == 0
 
-    def it_handles_fetch_errors(content_dir):
-        with patch("github_data_file_fetcher.fetch_file_content.fetch_file_content.get_client") as mock:
-            client = MagicMock()
-            client.get_file_content.side_effect = Exception("API Error")
-            mock.return_value = client
+    def it_handles_fetch_errors(content_dir, mock_github_client):
+        mock_github_client.get_file_content.side_effect = Exception("API Error")
 
-            stats = fetch_file_content(URLS[:1], content_dir)
+        stats = fetch_file_content(URLS[:1], content_dir)
 
         assert stats["fetched"] == 0
         assert stats["errors"] == 1
 
-    def it_skips_existing_files_with_zero_api_calls(content_dir):
+    def it_skips_existing_files_with_zero_api_calls(content_dir, mock_github_client):
         _create_content_on_disk(content_dir, URLS)
 
-        with patch("github_data_file_fetcher.fetch_file_content.fetch_file_content.get_client") as mock:
-            client = MagicMock()
-            mock.return_value = client
-
-            stats = fetch_file_content(URLS, content_dir)
+        stats = fetch_file_content(URLS, content_dir)
 
         assert stats["skipped"] == 2
         assert stats["fetched"] == 0
-        client.get_file_content.assert_not_called()
+        mock_github_client.get_file_content.assert_not_called()
 
 
 def describe_caching():
@@ -129,31 +154,65 @@ def describe_caching():
 
 def describe_graphql_fetch():
 
-    def it_skips_existing_files_on_disk(content_dir):
+    def it_skips_existing_files_on_disk(content_dir, thread_errors):
         _create_content_on_disk(content_dir, URLS)
 
         with patch("github_data_file_fetcher.fetch_file_content.fetch_graphql.GraphQLClient") as MockGQL:
-            gql = MagicMock()
+            gql = _mock_gql()
             MockGQL.return_value = gql
 
             stats = fetch_file_content_graphql(URLS, content_dir)
 
+        assert thread_errors == []
         assert stats["skipped"] == 2
         assert stats["fetched"] == 0
         gql.fetch_batch.assert_not_called()
 
-    def it_does_not_cache_truncated_blobs(cache_dir):
-        from github_data_file_fetcher.graphql import GraphQLClient
+    def it_writes_decoded_bytes_to_disk(content_dir, thread_errors):
+        url = URLS[0]
+        with patch("github_data_file_fetcher.fetch_file_content.fetch_graphql.GraphQLClient") as MockGQL:
+            gql = _mock_gql()
+            gql.map_batches.return_value = [
+                [FileResult("owner", "repo", "path/to/file.md", "main", content_b64="IyBow6lsbG8K")],
+            ]
+            MockGQL.return_value = gql
+
+            stats = fetch_file_content_graphql([url], content_dir)
+
+        assert thread_errors == []
+        assert stats["fetched"] == 1
+        local = content_dir / "owner" / "repo" / "blob" / "main" / "path" / "to" / "file.md"
+        assert local.read_bytes() == "# héllo\n".encode()
+
+    def it_writes_rest_fallback_content_as_decoded_bytes(content_dir, thread_errors):
+        url = URLS[0]
+        raw = b"# h\xe9llo\r\n"  # not valid UTF-8: must survive as-is
+        with (
+            patch("github_data_file_fetcher.fetch_file_content.fetch_graphql.GraphQLClient") as MockGQL,
+            patch("github_data_file_fetcher.fetch_file_content.fetch_graphql.get_client") as mock_rest,
+        ):
+            gql = _mock_gql()
+            gql.map_batches.return_value = [
+                [FileResult("owner", "repo", "path/to/file.md", "main", error="truncated")],
+            ]
+            MockGQL.return_value = gql
+            mock_rest.return_value.get_file_content.return_value = {
+                "content": base64.encodebytes(raw).decode("ascii"),
+            }
+
+            stats = fetch_file_content_graphql([url], content_dir)
+
+        assert thread_errors == []
+        assert stats["truncated_rest"] == 1
+        local = content_dir / "owner" / "repo" / "blob" / "main" / "path" / "to" / "file.md"
+        assert local.read_bytes() == raw
 
+    def it_does_not_cache_truncated_blobs(cache_dir):
         with patch("github_data_file_fetcher.graphql.get_settings") as ms:
             ms.return_value = MagicMock(github_token="fake")
             gql = GraphQLClient(cache_dir=cache_dir)
 
-        mock_resp = MagicMock()
-        mock_resp.status_code = 200
-        mock_resp.json.return_value = {
-            "data": {"r0": {"f0": {"text": "partial", "byteSize": 200000, "isTruncated": True}}}
-        }
+        mock_resp = MagicMock(status_code=200, content=_GQL_TRUNCATED)
         gql._client = MagicMock()
         gql._client.post.return_value = mock_resp
 
@@ -166,8 +225,6 @@ def describe_graphql_fetch():
         assert cached is None
 
     def it_skips_cached_items_in_graphql_batch(cache_dir):
-        from github_data_file_fetcher.graphql import GraphQLClient
-
         # Pre-populate cache for one item
         cache = Cache(cache_dir)
         cache.set("contents", {"owner": "o", "repo": "r", "path": "cached.md", "ref": "main"}, {
@@ -178,16 +235,7 @@ def describe_graphql_fetch():
             ms.return_value = MagicMock(github_token="fake")
             gql = GraphQLClient(cache_dir=cache_dir)
 
-        mock_resp = MagicMock()
-        mock_resp.status_code = 200
-        mock_resp.json.return_value = {
-            "data": {
-                "r0": {
-                    "f0": {"text": "hello", "byteSize": 5, "isTruncated": False},
-                    "f1": {"text": "world", "byteSize": 5, "isTruncated": False},
-                }
-            }
-        }
+        mock_resp = MagicMock(status_code=200, content=json.dumps(_gql_response([["hello", "world"]])).encode())
         gql._client = MagicMock()
         gql._client.post.return_value = mock_resp
 
@@ -203,7 +251,6 @@ def describe_graphql_fetch():
 
         # GraphQL query should only contain the uncached items
         call_args = gql._client.post.call_args
-        query = call_args[1]["json"]["query"]
-        assert "cached.md" not in query
-        assert "new1.md" in query
-        assert "new2.md" in query
+        query = json.loads(call_args[1]["content"])["query"]
+        paths = set(_QUERY_PATH_RE.findall(query))
+        assert paths == {"new1.md", "new2.md"}
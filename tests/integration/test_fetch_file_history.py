@@ -4,109 +4,92 @@ Real SQLite + real file-based Cache. Only external API calls (PyGithub/httpx) ar
 """
 
 import json
-import sqlite3
-from pathlib import Path
+from types import SimpleNamespace
 from unittest.mock import MagicMock, patch
 
 import pytest
 
 from github_data_file_fetcher.db import (
     get_files_without_history,
-    init_db,
-    insert_file_history,
+    insert_file_history_batch,
     insert_files,
 )
 from github_data_file_fetcher.fetch_file_history import fetch_file_history, fetch_file_history_graphql
 from github_data_file_fetcher.github import Cache
 
+pytestmark = pytest.mark.usefixtures("fast_sqlite_pragmas")
+
 
 @pytest.fixture
-def db_path(tmp_path):
-    p = tmp_path / "test.db"
-    init_db(p)
-    return p
+def mock_github_client():
+    """Patch get_client in fetch_file_history module to return a MagicMock."""
+    with patch("github_data_file_fetcher.fetch_file_history.fetch_file_history.get_client") as mock:
+        client = MagicMock()
+        mock.return_value = client
+        yield client
 
 
-@pytest.fixture
-def cache_dir(tmp_path):
-    d = tmp_path / "cache"
-    d.mkdir()
-    return d
+_URLS = tuple(f"https://github.com/owner/repo{i}/blob/main/file.md" for i in range(64))
+_SHAS = tuple(f"s{i}" for i in range(64))
 
 
 def _insert_test_files(db_path, count=3):
-    urls = [
-        f"https://github.com/owner/repo{i}/blob/main/file.md"
-        for i in range(count)
-    ]
-    insert_files(db_path, [{"html_url": u, "sha": f"s{i}"} for i, u in enumerate(urls)])
+    urls = list(_URLS[:count])
+    insert_files(db_path, [{"html_url": u, "sha": s} for u, s in zip(urls, _SHAS[:count], strict=True)])
     return urls
 
 
 def _mock_commit(sha="abc123def", author="Author", message="commit msg"):
-    c = MagicMock()
-    c.sha = sha
-    c.commit.author.name = author
-    c.commit.author.date = None
-    c.commit.message = message
-    return c
+    return SimpleNamespace(
+        sha=sha,
+        commit=SimpleNamespace(author=SimpleNamespace(name=author, date=None), message=message),
+    )
 
 
 def describe_rest_fetch():
 
-    def it_fetches_commit_history(db_path):
+    def it_fetches_commit_history(db_path, mock_github_client, query):
         url = "https://github.com/owner/repo/blob/main/path/file.md"
         insert_files(db_path, [{"html_url": url, "sha": "abc"}])
 
-        with patch("github_data_file_fetcher.fetch_file_history.fetch_file_history.get_client") as mock:
-            client = MagicMock()
-            client.cache.get.return_value = None
-            repo_mock = MagicMock()
-            repo_mock.get_commits.return_value = [_mock_commit()]
-            client.github.get_repo.return_value = repo_mock
-            mock.return_value = client
+        mock_github_client.cache.get.return_value = None
+        repo_mock = MagicMock()
+        repo_mock.get_commits.return_value = [_mock_commit()]
+        mock_github_client.github.get_repo.return_value = repo_mock
 
-            stats = fetch_file_history(db_path=db_path)
+        stats = fetch_file_history(db_path=db_path)
 
         assert stats["fetched"] == 1
         assert stats["errors"] == 0
 
-        conn = sqlite3.connect(db_path)
-        row = conn.execute("SELECT commits FROM file_history WHERE url = ?", (url,)).fetchone()
-        conn.close()
-        assert row is not None
-        commits = json.loads(row[0])
+        rows = query("SELECT commits FROM file_history WHERE url = ?", url)
+        assert rows
+        commits = json.loads(rows[0][0])
         assert len(commits) == 1
         assert commits[0]["sha"] == "abc123d"
 
-    def it_passes_ref_to_get_commits(db_path):
+    def it_passes_ref_to_get_commits(db_path, mock_github_client):
         """get_commits should be scoped to the ref from the URL, not just the default branch."""
         url = "https://github.com/owner/repo/blob/abc123def/path/file.md"
         insert_files(db_path, [{"html_url": url, "sha": "abc"}])
 
-        with patch("github_data_file_fetcher.fetch_file_history.fetch_file_history.get_client") as mock:
-            client = MagicMock()
-            client.cache.get.return_value = None
-            repo_mock = MagicMock()
-            repo_mock.get_commits.return_value = [_mock_commit()]
-            client.github.get_repo.return_value = repo_mock
-            mock.return_value = client
+        mock_github_client.cache.get.return_value = None
+        repo_mock = MagicMock()
+        repo_mock.get_commits.return_value = [_mock_commit()]
+        mock_github_client.github.get_repo.return_value = repo_mock
 
-            fetch_file_history(db_path=db_path)
+        fetch_file_history(db_path=db_path)
 
         repo_mock.get_commits.assert_called_once_with(path="path/file.md", sha="abc123def")
 
-    def it_handles_history_errors(db_path):
+    def it_handles_history_errors(db_path, mock_github_client):
         url = "https://github.com/owner/repo/blob/main/file.md"
         insert_files(db_path, [{"html_url": url, "sha": "abc"}])
 
-        with patch("github_data_file_fetcher.fetch_file_history.fetch_file_history.get_client") as mock:
-            client = MagicMock()
-            client.cache.get.return_value = None
-            client.github.get_repo.side_effect = Exception("API Error")
-            mock.return_value = client
+        mock_github_client.cache.get.return_value = None
+        mock_github_client.github.get_repo.side_effect = Exception("API Error")
 
-            stats = fetch_file_history(db_path=db_path)
+        stats = fetch_file_history(db_path=db_path)
 
         assert stats["fetched"] == 0
         assert stats["errors"] == 1
@@ -114,28 +97,23 @@ def describe_rest_fetch():
 
 def describe_skip_completed():
 
-    def it_skips_files_already_with_history(db_path):
+    def it_skips_files_already_with_history(db_path, mock_github_client):
         urls = _insert_test_files(db_path, 3)
-        for url in urls:
-            insert_file_history(db_path, url, [{"sha": "abc", "message": "init"}])
+        insert_file_history_batch(db_path, [(url, [{"sha": "abc", "message": "init"}]) for url in urls])
 
         assert len(get_files_without_history(db_path)) == 0
 
-        with patch("github_data_file_fetcher.fetch_file_history.fetch_file_history.get_client") as mock:
-            client = MagicMock()
-            client.cache = MagicMock()
-            mock.return_value = client
+        mock_github_client.cache = MagicMock()
 
-            stats = fetch_file_history(db_path=db_path)
+        stats = fetch_file_history(db_path=db_path)
 
         assert stats["fetched"] == 0
         assert stats["errors"] == 0
-        client.github.get_repo.assert_not_called()
+        mock_github_client.github.get_repo.assert_not_called()
 
     def it_skips_files_already_with_history_graphql(db_path):
         urls = _insert_test_files(db_path, 3)
-        for url in urls:
-            insert_file_history(db_path, url, [{"sha": "abc", "message": "init"}])
+        insert_file_history_batch(db_path, [(url, [{"sha": "abc", "message": "init"}]) for url in urls])
 
         with patch("github_data_file_fetcher.fetch_file_history.fetch_graphql.GraphQLClient") as MockGQL:
             gql = MagicMock()
@@ -149,7 +127,7 @@ def describe_skip_completed():
 
 def describe_cache_interaction():
 
-    def it_uses_cache_hit_to_populate_db(db_path, cache_dir):
+    def it_uses_cache_hit_to_populate_db(db_path, cache_dir, mock_github_client, query):
         """When cache has history, REST fetch reads from cache and inserts to DB."""
         url = "https://github.com/owner/repo/blob/main/file.md"
         insert_files(db_path, [{"html_url": url, "sha": "abc"}])
@@ -159,19 +137,13 @@ def describe_cache_interaction():
             "commits": [{"sha": "cached1", "message": "from cache"}],
         })
 
-        with patch("github_data_file_fetcher.fetch_file_history.fetch_file_history.get_client") as mock:
-            client = MagicMock()
-            client.cache = cache
-            mock.return_value = client
+        mock_github_client.cache = cache
 
-            stats = fetch_file_history(db_path=db_path)
+        stats = fetch_file_history(db_path=db_path)
 
         assert stats["fetched"] == 1
         assert stats["cache_hits"] == 1
-        client.github.get_repo.assert_not_called()
+        mock_github_client.github.get_repo.assert_not_called()
 
-        conn = sqlite3.connect(db_path)
-        row = conn.execute("SELECT commits FROM file_history WHERE url = ?", (url,)).fetchone()
-        conn.close()
-        commits = json.loads(row[0])
+        commits = json.loads(query("SELECT commits FROM file_history WHERE url = ?", url)[0][0])
         assert commits[0]["sha"] == "cached1"
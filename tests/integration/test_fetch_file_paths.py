@@ -4,33 +4,18 @@ Real SQLite + real file-based Cache. Only external API calls (PyGithub) are mock
 """
 
 import sqlite3
-from pathlib import Path
 from unittest.mock import MagicMock, patch
 
 import pytest
 
-from github_data_file_fetcher.db import get_all_urls, get_file_count, init_db, insert_files
+from github_data_file_fetcher.db import (
+    get_all_urls,
+    get_file_count,
+    update_scan_progress,
+)
 from github_data_file_fetcher.fetch_file_paths import fetch_file_paths
-from github_data_file_fetcher.github import Cache, GitHubClient
 
-
-@pytest.fixture
-def db_path(tmp_path):
-    p = tmp_path / "test.db"
-    init_db(p)
-    return p
-
-
-@pytest.fixture
-def cache_dir(tmp_path):
-    d = tmp_path / "cache"
-    d.mkdir()
-    return d
-
-
-@pytest.fixture
-def client(cache_dir):
-    return GitHubClient(cache_dir=cache_dir)
+pytestmark = pytest.mark.usefixtures("fast_sqlite_pragmas")
 
 
 @pytest.fixture
@@ -44,13 +29,8 @@ def mock_github_client():
 
 def describe_collect_files():
 
-    def it_initializes_database(db_path):
-        conn = sqlite3.connect(db_path)
-        cursor = conn.execute(
-            "SELECT name FROM sqlite_master WHERE type='table' ORDER BY name"
-        )
-        tables = [row[0] for row in cursor.fetchall()]
-        conn.close()
+    def it_initializes_database(query):
+        tables = [row[0] for row in query("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name")]
 
         assert "content_status" in tables
         assert "files" in tables
@@ -59,18 +39,8 @@ def describe_collect_files():
         assert "search_hits" in tables
 
     def it_collects_files_from_search(db_path, mock_github_client):
-        call_count = [0]
-
-        def search_side_effect(*args, **kwargs):
-            call_count[0] += 1
-            if call_count[0] == 1:
-                return {"total_count": 2}
-            elif call_count[0] == 2:
-                return {"total_count": 2}
-            else:
-                return {"total_count": 0}
-
-        mock_github_client.search_code.side_effect = search_side_effect
+        counts = iter([{"total_count": 2}, {"total_count": 2}])
+        mock_github_client.search_code.side_effect = lambda *a, **k: next(counts, {"total_count": 0})
 
         with patch(
             "github_data_file_fetcher.fetch_file_paths.fetch_file_paths.fetch_files"
@@ -95,16 +65,8 @@ def describe_collect_files():
         conn.commit()
         conn.close()
 
-        call_count = [0]
-
-        def search_side_effect(*args, **kwargs):
-            call_count[0] += 1
-            if call_count[0] <= 2:
-                return {"total_count": 1}
-            else:
-                return {"total_count": 0}
-
-        mock_github_client.search_code.side_effect = search_side_effect
+        counts = iter([{"total_count": 1}, {"total_count": 1}])
+        mock_github_client.search_code.side_effect = lambda *a, **k: next(counts, {"total_count": 0})
 
         with patch(
             "github_data_file_fetcher.fetch_file_paths.fetch_file_paths.fetch_files"
@@ -183,8 +145,6 @@ def describe_early_exit():
 
     def it_exits_immediately_when_scan_already_completed(db_path):
         """If scan_progress shows completed, fetch_file_paths returns without any API calls."""
-        from github_data_file_fetcher.db import update_scan_progress
-
         update_scan_progress(db_path, "filename:CLAUDE.md", last_lo=1000000, max_size=1000000, collected=100, completed=True)
 
         with patch("github_data_file_fetcher.fetch_file_paths.fetch_file_paths.get_client") as mock_get:
@@ -198,8 +158,6 @@ def describe_early_exit():
 
     def it_resumes_from_last_lo_on_interrupted_scan(db_path):
         """If scan was interrupted, resume from the saved lo position."""
-        from github_data_file_fetcher.db import update_scan_progress
-
         # Simulate interrupted scan at lo=500000
         update_scan_progress(db_path, "filename:CLAUDE.md", last_lo=500000, max_size=1000000, collected=50)
 
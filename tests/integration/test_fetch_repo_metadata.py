@@ -3,44 +3,40 @@
 Real SQLite + real file-based Cache. Only external API calls (PyGithub/httpx) are mocked.
 """
 
-import sqlite3
-from pathlib import Path
+from types import SimpleNamespace
 from unittest.mock import MagicMock, patch
 
 import pytest
 
 from github_data_file_fetcher.db import (
     get_repos_without_metadata,
-    init_db,
     insert_files,
-    insert_repo_metadata,
+    insert_repo_metadata_batch,
 )
 from github_data_file_fetcher.fetch_repo_metadata import fetch_repo_metadata, fetch_repo_metadata_graphql
 from github_data_file_fetcher.github import Cache
 
+pytestmark = pytest.mark.usefixtures("fast_sqlite_pragmas")
+
 
 @pytest.fixture
-def db_path(tmp_path):
-    p = tmp_path / "test.db"
-    init_db(p)
-    return p
+def mock_github_client():
+    """Patch get_client in fetch_repo_metadata module to return a MagicMock."""
+    with patch("github_data_file_fetcher.fetch_repo_metadata.fetch_repo_metadata.get_client") as mock:
+        client = MagicMock()
+        mock.return_value = client
+        yield client
 
 
-@pytest.fixture
-def cache_dir(tmp_path):
-    d = tmp_path / "cache"
-    d.mkdir()
-    return d
+_URLS = tuple(f"https://github.com/owner/repo{i}/blob/main/f.md" for i in range(64))
+_SHAS = tuple(f"s{i}" for i in range(64))
+_REPO_KEYS = tuple(f"owner/repo{i}" for i in range(64))
 
 
 def _insert_repos(db_path, count=3):
     """Insert files so repos are discoverable."""
-    files = [
-        {"html_url": f"https://github.com/owner/repo{i}/blob/main/f.md", "sha": f"s{i}"}
-        for i in range(count)
-    ]
-    insert_files(db_path, files)
-    return [f"owner/repo{i}" for i in range(count)]
+    insert_files(db_path, [{"html_url": u, "sha": s} for u, s in zip(_URLS[:count], _SHAS[:count], strict=True)])
+    return list(_REPO_KEYS[:count])
 
 
 def _make_metadata(**overrides):
@@ -55,52 +51,44 @@ def _make_metadata(**overrides):
 
 
 def _mock_repo_obj(**overrides):
-    repo = MagicMock()
-    repo.stargazers_count = overrides.get("stars", 100)
-    repo.forks_count = overrides.get("forks", 20)
-    repo.watchers_count = overrides.get("watchers", 50)
-    repo.language = overrides.get("language", "Python")
-    repo.get_topics.return_value = overrides.get("topics", ["ai", "ml"])
-    repo.created_at = None
-    repo.updated_at = None
-    repo.pushed_at = None
-    repo.default_branch = "main"
-    repo.license = None
-    repo.description = "Test repo"
-    return repo
+    topics = overrides.get("topics", ["ai", "ml"])
+    return SimpleNamespace(
+        stargazers_count=overrides.get("stars", 100),
+        forks_count=overrides.get("forks", 20),
+        watchers_count=overrides.get("watchers", 50),
+        language=overrides.get("language", "Python"),
+        get_topics=lambda: topics,
+        created_at=None,
+        updated_at=None,
+        pushed_at=None,
+        default_branch="main",
+        license=None,
+        description="Test repo",
+    )
 
 
 def describe_rest_fetch():
 
-    def it_fetches_metadata_for_repos(db_path):
+    def it_fetches_metadata_for_repos(db_path, mock_github_client, query):
         _insert_repos(db_path, 2)
 
-        with patch("github_data_file_fetcher.fetch_repo_metadata.fetch_repo_metadata.get_client") as mock:
-            client = MagicMock()
-            client.cache.get.return_value = None
-            client.github.get_repo.return_value = _mock_repo_obj()
-            mock.return_value = client
+        mock_github_client.cache.get.return_value = None
+        mock_github_client.github.get_repo.return_value = _mock_repo_obj()
 
-            stats = fetch_repo_metadata(db_path=db_path)
+        stats = fetch_repo_metadata(db_path=db_path)
 
         assert stats["fetched"] == 2
         assert stats["errors"] == 0
 
-        conn = sqlite3.connect(db_path)
-        count = conn.execute("SELECT COUNT(*) FROM repo_metadata").fetchone()[0]
-        conn.close()
-        assert count == 2
+        assert query("SELECT COUNT(*) FROM repo_metadata") == [(2,)]
 
-    def it_handles_metadata_errors(db_path):
+    def it_handles_metadata_errors(db_path, mock_github_client):
         _insert_repos(db_path, 1)
 
-        with patch("github_data_file_fetcher.fetch_repo_metadata.fetch_repo_metadata.get_client") as mock:
-            client = MagicMock()
-            client.cache.get.return_value = None
-            client.github.get_repo.side_effect = Exception("API Error")
-            mock.return_value = client
+        mock_github_client.cache.get.return_value = None
+        mock_github_client.github.get_repo.side_effect = Exception("API Error")
 
-            stats = fetch_repo_metadata(db_path=db_path)
+        stats = fetch_repo_metadata(db_path=db_path)
 
         assert stats["fetched"] == 0
         assert stats["errors"] == 1
@@ -108,28 +96,23 @@ def describe_rest_fetch():
 
 def describe_skip_completed():
 
-    def it_skips_repos_already_in_db(db_path):
+    def it_skips_repos_already_in_db(db_path, mock_github_client):
         repos = _insert_repos(db_path, 3)
-        for rk in repos:
-            insert_repo_metadata(db_path, rk, _make_metadata())
+        insert_repo_metadata_batch(db_path, [(rk, _make_metadata()) for rk in repos])
 
         assert len(get_repos_without_metadata(db_path)) == 0
 
-        with patch("github_data_file_fetcher.fetch_repo_metadata.fetch_repo_metadata.get_client") as mock:
-            client = MagicMock()
-            client.cache = MagicMock()
-            mock.return_value = client
+        mock_github_client.cache = MagicMock()
 
-            stats = fetch_repo_metadata(db_path=db_path)
+        stats = fetch_repo_metadata(db_path=db_path)
 
         assert stats["fetched"] == 0
         assert stats["errors"] == 0
-        client.github.get_repo.assert_not_called()
+        mock_github_client.github.get_repo.assert_not_called()
 
     def it_skips_repos_already_in_db_graphql(db_path):
         repos = _insert_repos(db_path, 3)
-        for rk in repos:
-            insert_repo_metadata(db_path, rk, _make_metadata())
+        insert_repo_metadata_batch(db_path, [(rk, _make_metadata()) for rk in repos])
 
         with patch("github_data_file_fetcher.fetch_repo_metadata.fetch_graphql.GraphQLClient") as MockGQL:
             gql = MagicMock()
@@ -143,7 +126,7 @@ def describe_skip_completed():
 
 def describe_cache_interaction():
 
-    def it_uses_cache_hit_to_populate_db(db_path, cache_dir):
+    def it_uses_cache_hit_to_populate_db(db_path, cache_dir, mock_github_client, query):
         """When cache has metadata, REST fetch reads from cache and inserts to DB."""
         repos = _insert_repos(db_path, 1)
         repo_key = repos[0]
@@ -152,25 +135,19 @@ def describe_cache_interaction():
         cache = Cache(cache_dir)
         cache.set("repo_metadata", {"repo_key": repo_key}, _make_metadata(stars=999))
 
-        with patch("github_data_file_fetcher.fetch_repo_metadata.fetch_repo_metadata.get_client") as mock:
-            client = MagicMock()
-            client.cache = cache
-            mock.return_value = client
+        mock_github_client.cache = cache
 
-            stats = fetch_repo_metadata(db_path=db_path)
+        stats = fetch_repo_metadata(db_path=db_path)
 
         assert stats["fetched"] == 1
         assert stats["cache_hits"] == 1
         # No API call needed
-        client.github.get_repo.assert_not_called()
+        mock_github_client.github.get_repo.assert_not_called()
 
         # Verify DB got the cached data
-        conn = sqlite3.connect(db_path)
-        row = conn.execute("SELECT stars FROM repo_metadata WHERE repo_key = ?", (repo_key,)).fetchone()
-        conn.close()
-        assert row[0] == 999
+        assert query("SELECT stars FROM repo_metadata WHERE repo_key = ?", repo_key) == [(999,)]
 
-    def it_skips_cached_errors_by_default(db_path, cache_dir):
+    def it_skips_cached_errors_by_default(db_path, cache_dir, mock_github_client):
         """Cached error entries are treated as final by default."""
         repos = _insert_repos(db_path, 1)
         repo_key = repos[0]
@@ -178,18 +155,15 @@ def describe_cache_interaction():
         cache = Cache(cache_dir)
         cache.set("repo_metadata", {"repo_key": repo_key}, {"error": "not_found"})
 
-        with patch("github_data_file_fetcher.fetch_repo_metadata.fetch_repo_metadata.get_client") as mock:
-            client = MagicMock()
-            client.cache = cache
-            mock.return_value = client
+        mock_github_client.cache = cache
 
-            stats = fetch_repo_metadata(db_path=db_path)
+        stats = fetch_repo_metadata(db_path=db_path)
 
         assert stats["errors"] == 1
         assert stats["cache_hits"] == 1
-        client.github.get_repo.assert_not_called()
+        mock_github_client.github.get_repo.assert_not_called()
 
-    def it_retries_cached_errors_when_flag_set(db_path, cache_dir):
+    def it_retries_cached_errors_when_flag_set(db_path, cache_dir, mock_github_client):
         """With retry_errors=True, cached error entries are ignored and re-fetched."""
         repos = _insert_repos(db_path, 1)
         repo_key = repos[0]
@@ -197,14 +171,11 @@ def describe_cache_interaction():
         cache = Cache(cache_dir)
         cache.set("repo_metadata", {"repo_key": repo_key}, {"error": "not_found"})
 
-        with patch("github_data_file_fetcher.fetch_repo_metadata.fetch_repo_metadata.get_client") as mock:
-            client = MagicMock()
-            client.cache = cache
-            client.github.get_repo.return_value = _mock_repo_obj(stars=42)
-            mock.return_value = client
+        mock_github_client.cache = cache
+        mock_github_client.github.get_repo.return_value = _mock_repo_obj(stars=42)
 
-            stats = fetch_repo_metadata(db_path=db_path, retry_errors=True)
+        stats = fetch_repo_metadata(db_path=db_path, retry_errors=True)
 
         assert stats["fetched"] == 1
         assert stats["errors"] == 0
-        client.github.get_repo.assert_called_once()
+        mock_github_client.github.get_repo.assert_called_once()
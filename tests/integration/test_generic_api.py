@@ -5,39 +5,62 @@ Cachetta writes real files to tmp dirs. Only external HTTP calls (httpx) are moc
 
 import hashlib
 import json
+from types import SimpleNamespace
 from unittest.mock import MagicMock, patch
 
 import httpx
+import orjson
 import pytest
 
+from github_data_file_fetcher.cli import main
 from github_data_file_fetcher.generic_client import GenericGitHubClient, _parse_retry_after
+from github_data_file_fetcher.graphql import GraphQLClient
 from github_data_file_fetcher.models import ApiResponse
 
 
-@pytest.fixture
-def cache_dir(tmp_path):
-    d = tmp_path / "cache"
-    d.mkdir()
-    return d
-
-
-@pytest.fixture(autouse=True)
+@pytest.fixture(scope="module", autouse=True)
 def _no_sleep():
-    """Patch out time.sleep in generic_client to avoid real waits in retry tests."""
+    """Patch out time.sleep in generic_client to avoid real waits in retry tests.
+
+    Module-scoped rather than session-scoped: the target is the shared time
+    module, so the patch must not outlive this file's tests.
+    """
     with patch("github_data_file_fetcher.generic_client.time.sleep"):
         yield
 
 
-@pytest.fixture
+@pytest.fixture(scope="module")
+def cache_dir(tmp_path_factory):
+    """One cache dir per module, emptied before each test by _reset_client."""
+    return tmp_path_factory.mktemp("cache")
+
+
+@pytest.fixture(scope="module", autouse=True)
+def _patch_settings():
+    """Fake token for every client built in this module."""
+    settings = MagicMock(github_token="test-token")
+    with patch("github_data_file_fetcher.generic_client.get_settings", return_value=settings), \
+            patch("github_data_file_fetcher.graphql.get_settings", return_value=settings):
+        yield
+
+
+@pytest.fixture(scope="module")
 def client(cache_dir):
-    with patch("github_data_file_fetcher.generic_client.get_settings") as mock_settings:
-        mock_settings.return_value = MagicMock(github_token="test-token")
-        c = GenericGitHubClient(cache_dir=cache_dir)
+    """One client per module, so the httpx.Client is built once."""
+    c = GenericGitHubClient(cache_dir=cache_dir)
     # Disable throttle for tests
     c._min_interval = 0
     return c
 
 
+@pytest.fixture(autouse=True)
+def _reset_client(client, cache_dir):
+    """Isolate tests sharing the module client: fresh transport mock, empty cache."""
+    client._client.request = MagicMock()
+    for p in cache_dir.glob("*.json"):
+        p.unlink()
+
+
 def _cache_key(endpoint, params=None):
     """Reproduce the cache key hash for verifying file existence."""
     params = params or {}
@@ -45,13 +68,23 @@ def _cache_key(endpoint, params=None):
     return hashlib.sha256(raw.encode()).hexdigest()[:16]
 
 
-def _write_cache_file(cache_dir, endpoint, params, data):
+# Cache file contents reused across tests, serialized once at import
+_FIXED_CACHE_PAYLOADS = {
+    label: orjson.dumps(data)
+    for label, data in {
+        "repo_hit": {"status": 200, "body": {"id": 1}, "etag": '"xyz"', "link": None},
+        "repo_stale": {"status": 200, "body": {"cached": True}},
+        "viewer": {"data": {"viewer": {"login": "test-user"}}},
+    }.items()
+}
+
+
+def _write_cache_file(cache_dir, endpoint, params, data=None, raw=None):
     """Write a cache file in the format Cachetta expects (plain JSON)."""
     key = _cache_key(endpoint, params)
     path = cache_dir / f"{key}.json"
     path.parent.mkdir(parents=True, exist_ok=True)
-    with open(path, "w") as f:
-        json.dump(data, f)
+    path.write_bytes(raw if raw is not None else orjson.dumps(data))
 
 
 def _cache_file_exists(cache_dir, endpoint, params=None):
@@ -60,15 +93,56 @@ def _cache_file_exists(cache_dir, endpoint, params=None):
     return (cache_dir / f"{key}.json").exists()
 
 
+_REQUEST = httpx.Request("GET", "https://api.github.com")
+
+
+class _FakeResponse:
+    """The slice of httpx.Response that the client reads.
+
+    text/content are serialized from the body on first access only.
+    """
+
+    __slots__ = ("status_code", "headers", "request", "_body", "_text", "_content")
+
+    def __init__(self, status_code, body, headers):
+        self.status_code = status_code
+        self.headers = headers
+        self.request = _REQUEST
+        self._body = body
+        self._text = None
+        self._content = None
+
+    def json(self):
+        return self._body
+
+    @property
+    def content(self):
+        if self._content is None:
+            self._content = orjson.dumps(self._body) if self._body is not None else b""
+        return self._content
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = self.content.decode()
+        return self._text
+
+
 def _mock_response(status_code=200, json_body=None, headers=None):
-    resp = MagicMock(spec=httpx.Response)
-    resp.status_code = status_code
-    resp.content = json.dumps(json_body).encode() if json_body is not None else b""
-    resp.json.return_value = json_body
-    resp.text = json.dumps(json_body) if json_body is not None else ""
-    resp.headers = headers or {}
-    resp.request = MagicMock()
-    return resp
+    return _FakeResponse(status_code, json_body, headers or {})
+
+
+# Shared canned responses: the client only reads them, so one instance serves every test
+_SUCCESS = _mock_response(200, {"ok": True})
+_BAD_GATEWAY = _mock_response(502, {"message": "Bad Gateway"})
+# First responses that the client retries past; each is built once and shared
+_RETRY_SCENARIOS = (
+    _mock_response(429, {"message": "rate limit"}, headers={"retry-after": "0"}),
+    _mock_response(403, {"message": "API rate limit exceeded"}, headers={"retry-after": "0"}),
+    _BAD_GATEWAY,
+    httpx.ConnectError("connection failed"),
+)
+_RETRY_IDS = ("429", "403-rate-limit", "5xx", "connection-error")
 
 
 class TestApiResponse:
@@ -86,63 +160,70 @@ class TestApiResponse:
 
 
 class TestGenericGitHubClient:
-    def test_cache_hit(self, client, cache_dir):
-        """Cached responses are returned without HTTP calls."""
-        _write_cache_file(cache_dir, "repos/o/r", {}, {
-            "status": 200,
-            "body": {"id": 1},
-            "etag": '"xyz"',
-            "link": None,
-        })
-        resp = client.api("repos/o/r")
-        assert resp.status == 200
-        assert resp.body == {"id": 1}
-        assert resp.etag == '"xyz"'
+    @pytest.mark.parametrize("preload,response,skip_cache,expected,expect_http,expect_cached", [
+        pytest.param(
+            "repo_hit", None, False,
+            ApiResponse(status=200, body={"id": 1}, etag='"xyz"'), False, True,
+            id="hit",
+        ),
+        pytest.param(
+            None,
+            _mock_response(200, {"full_name": "o/r"}, headers={"etag": '"e1"', "link": "<next>"}),
+            False, ApiResponse(status=200, body={"full_name": "o/r"}, etag='"e1"', link="<next>"),
+            True, True,
+            id="miss-2xx",
+        ),
+        pytest.param(
+            None, _mock_response(404, {"message": "Not Found"}), False, None, True, False,
+            id="non-2xx-not-cached",
+        ),
+        pytest.param(
+            "repo_stale", _mock_response(200, {"cached": False}), True,
+            ApiResponse(status=200, body={"cached": False}), True, True,
+            id="skip-cache-refetches-and-writes",
+        ),
+    ])
+    def test_cache_behavior(
+        self, client, cache_dir, preload, response, skip_cache, expected, expect_http, expect_cached
+    ):
+        """Hits skip HTTP, 2xx misses are cached, errors are not, skip_cache bypasses reads only."""
+        if preload:
+            _write_cache_file(cache_dir, "repos/o/r", {}, raw=_FIXED_CACHE_PAYLOADS[preload])
+        client._client.request.return_value = response
+
+        if expected is None:
+            with pytest.raises(httpx.HTTPStatusError):
+                client.api("repos/o/r", skip_cache=skip_cache)
+        else:
+            assert client.api("repos/o/r", skip_cache=skip_cache) == expected
+        assert client._client.request.called == expect_http
+        assert _cache_file_exists(cache_dir, "repos/o/r") == expect_cached
+
+        if expect_cached:
+            # Follow-up read is served from cache
+            client._client.request.reset_mock()
+            assert client.api("repos/o/r") == expected
+            client._client.request.assert_not_called()
+
+    def test_revalidates_with_etag(self, client):
+        """A 304 on revalidation returns the previously cached body."""
+        client._client.request = MagicMock(
+            return_value=_mock_response(200, {"id": 1}, headers={"etag": '"e1"'})
+        )
+        client.api("repos/o/r")
 
-    def test_cache_miss_200(self, client, cache_dir):
-        """2xx responses are cached and returned."""
-        body = {"full_name": "owner/repo"}
-        mock_resp = _mock_response(200, body, headers={"etag": '"e1"', "link": "<next>"})
-        client._client.request = MagicMock(return_value=mock_resp)
+        client._client.request = MagicMock(return_value=_mock_response(304))
+        resp = client.api("repos/o/r", skip_cache=True)
 
-        resp = client.api("repos/owner/repo")
-        assert resp.status == 200
-        assert resp.body == body
+        assert resp.body == {"id": 1}
         assert resp.etag == '"e1"'
-        assert resp.link == "<next>"
-
-        # Second call hits cache
-        client._client.request.reset_mock()
-        resp2 = client.api("repos/owner/repo")
-        assert resp2.body == body
-        client._client.request.assert_not_called()
-
-        # Verify file was written
-        assert _cache_file_exists(cache_dir, "repos/owner/repo")
-
-    def test_only_caches_2xx(self, client, cache_dir):
-        """Non-2xx responses are NOT cached."""
-        resp_404 = _mock_response(404, {"message": "Not Found"})
-        client._client.request = MagicMock(return_value=resp_404)
-
-        with pytest.raises(httpx.HTTPStatusError):
-            client.api("repos/gone/repo")
-
-        assert not _cache_file_exists(cache_dir, "repos/gone/repo")
-
-    def test_skip_cache(self, client, cache_dir):
-        """skip_cache bypasses cache reads but still writes."""
-        _write_cache_file(cache_dir, "repos/o/r", {}, {
-            "status": 200,
-            "body": {"cached": True},
-        })
-        fresh_body = {"cached": False}
-        mock_resp = _mock_response(200, fresh_body)
-        client._client.request = MagicMock(return_value=mock_resp)
+        headers = client._client.request.call_args[1]["headers"]
+        assert headers == {"If-None-Match": '"e1"'}
 
-        resp = client.api("repos/o/r", skip_cache=True)
-        assert resp.body == {"cached": False}
-        client._client.request.assert_called_once()
+    def test_no_etag_header_without_cached_entry(self, client):
+        client._client.request = MagicMock(return_value=_mock_response(200, {"id": 1}))
+        client.api("repos/o/r")
+        assert client._client.request.call_args[1]["headers"] is None
 
     def test_204_no_content(self, client):
         """204 responses return empty body."""
@@ -183,55 +264,23 @@ class TestGenericGitHubClient:
         assert calls[0] == "https://api.github.com/repos/o/r"
         assert calls[0] == calls[1]
 
-    def test_rate_limit_retry(self, client):
-        """429 triggers retry with eventual success."""
-        rate_limited = _mock_response(429, {"message": "rate limit"}, headers={"retry-after": "0"})
-        success = _mock_response(200, {"ok": True})
-        client._client.request = MagicMock(side_effect=[rate_limited, success])
+    @pytest.mark.parametrize("failure", _RETRY_SCENARIOS, ids=_RETRY_IDS)
+    def test_retry_then_success(self, client, failure):
+        """Rate limits (429, 403 'rate limit'), 5xx and connection errors are retried."""
+        client._client.request = MagicMock(side_effect=[failure, _SUCCESS])
 
         resp = client.api("repos/o/r")
         assert resp.status == 200
         assert client._client.request.call_count == 2
 
-    def test_403_rate_limit_retry(self, client):
-        """403 with 'rate limit' in body triggers retry."""
-        rate_limited = _mock_response(403, {"message": "API rate limit exceeded"})
-        rate_limited.text = "API rate limit exceeded"
-        rate_limited.headers = {"retry-after": "0"}
-        success = _mock_response(200, {"ok": True})
-        client._client.request = MagicMock(side_effect=[rate_limited, success])
-
-        resp = client.api("repos/o/r")
-        assert resp.status == 200
-
-    def test_5xx_retry(self, client):
-        """5xx errors are retried."""
-        server_error = _mock_response(502, {"message": "Bad Gateway"})
-        success = _mock_response(200, {"ok": True})
-        client._client.request = MagicMock(side_effect=[server_error, success])
-
-        resp = client.api("repos/o/r")
-        assert resp.status == 200
-
     @patch("github_data_file_fetcher.generic_client.MAX_RETRIES", 3)
     def test_retries_exhausted(self, client):
         """RuntimeError after MAX_RETRIES."""
-        server_error = _mock_response(502, {"message": "Bad Gateway"})
-        client._client.request = MagicMock(return_value=server_error)
+        client._client.request = MagicMock(return_value=_BAD_GATEWAY)
 
         with pytest.raises(RuntimeError, match="failed after"):
             client.api("repos/o/r")
 
-    def test_connection_error_retry(self, client):
-        """Transient connection errors are retried."""
-        success = _mock_response(200, {"ok": True})
-        client._client.request = MagicMock(
-            side_effect=[httpx.ConnectError("connection failed"), success]
-        )
-
-        resp = client.api("repos/o/r")
-        assert resp.status == 200
-
     def test_params_in_cache_key(self, client):
         """Different params produce different cache entries."""
         body1 = {"page": 1}
@@ -249,19 +298,13 @@ class TestGenericGitHubClient:
 
 class TestParseRetryAfter:
     def test_present(self):
-        resp = MagicMock()
-        resp.headers = {"retry-after": "30"}
-        assert _parse_retry_after(resp) == 30.0
+        assert _parse_retry_after(SimpleNamespace(headers={"retry-after": "30"})) == 30.0
 
     def test_missing(self):
-        resp = MagicMock()
-        resp.headers = {}
-        assert _parse_retry_after(resp) is None
+        assert _parse_retry_after(SimpleNamespace(headers={})) is None
 
     def test_invalid(self):
-        resp = MagicMock()
-        resp.headers = {"retry-after": "not-a-number"}
-        assert _parse_retry_after(resp) is None
+        assert _parse_retry_after(SimpleNamespace(headers={"retry-after": "not-a-number"})) is None
 
 
 class TestGraphqlGenericMethod:
@@ -271,29 +314,22 @@ class TestGraphqlGenericMethod:
         """Pre-populated cache file is returned without API call."""
         # Write cache file using the graphql cache path format
         params = {"query": "{ viewer { login } }", "variables": {}}
-        raw = f"graphql|{json.dumps(params, sort_keys=True)}"
-        key = hashlib.sha256(raw.encode()).hexdigest()[:16]
+        key = _cache_key("graphql", params)
         cache_file = cache_dir / f"{key}.json"
-        cache_file.write_text(json.dumps({"data": {"viewer": {"login": "test-user"}}}))
+        cache_file.write_bytes(_FIXED_CACHE_PAYLOADS["viewer"])
 
-        with patch("github_data_file_fetcher.graphql.get_settings") as mock_settings:
-            mock_settings.return_value = MagicMock(github_token="test-token")
-            from github_data_file_fetcher.graphql import GraphQLClient
-            gql = GraphQLClient(cache_dir=cache_dir)
+        gql = GraphQLClient(cache_dir=cache_dir)
 
         result = gql.graphql("{ viewer { login } }")
         assert result == {"data": {"viewer": {"login": "test-user"}}}
 
     def test_cache_miss(self, cache_dir):
-        with patch("github_data_file_fetcher.graphql.get_settings") as mock_settings:
-            mock_settings.return_value = MagicMock(github_token="test-token")
-            from github_data_file_fetcher.graphql import GraphQLClient
-            gql = GraphQLClient(cache_dir=cache_dir)
+        gql = GraphQLClient(cache_dir=cache_dir)
 
         body = {"data": {"repository": {"name": "test"}}}
         mock_resp = MagicMock()
         mock_resp.status_code = 200
-        mock_resp.json.return_value = body
+        mock_resp.content = orjson.dumps(body)
         gql._client.post = MagicMock(return_value=mock_resp)
         gql._min_interval = 0
 
@@ -302,20 +338,15 @@ class TestGraphqlGenericMethod:
 
         # Verify cache file was written
         params = {"query": "{ repository(owner:\"o\", name:\"r\") { name } }", "variables": {}}
-        raw = f"graphql|{json.dumps(params, sort_keys=True)}"
-        key = hashlib.sha256(raw.encode()).hexdigest()[:16]
-        assert (cache_dir / f"{key}.json").exists()
+        assert _cache_file_exists(cache_dir, "graphql", params)
 
     def test_error_not_cached(self, cache_dir):
-        with patch("github_data_file_fetcher.graphql.get_settings") as mock_settings:
-            mock_settings.return_value = MagicMock(github_token="test-token")
-            from github_data_file_fetcher.graphql import GraphQLClient
-            gql = GraphQLClient(cache_dir=cache_dir)
+        gql = GraphQLClient(cache_dir=cache_dir)
 
         body = {"errors": [{"message": "some error"}]}
         mock_resp = MagicMock()
         mock_resp.status_code = 200
-        mock_resp.json.return_value = body
+        mock_resp.content = orjson.dumps(body)
         gql._client.post = MagicMock(return_value=mock_resp)
         gql._min_interval = 0
 
@@ -324,9 +355,7 @@ class TestGraphqlGenericMethod:
 
         # No cache file written
         params = {"query": "{ bad query }", "variables": {}}
-        raw = f"graphql|{json.dumps(params, sort_keys=True)}"
-        key = hashlib.sha256(raw.encode()).hexdigest()[:16]
-        assert not (cache_dir / f"{key}.json").exists()
+        assert not _cache_file_exists(cache_dir, "graphql", params)
 
 
 class TestCliApiSubcommand:
@@ -341,9 +370,7 @@ class TestCliApiSubcommand:
             mock_client.api.return_value = mock_resp
             mock_get.return_value = mock_client
 
-            from github_data_file_fetcher.cli import main
-            with patch("sys.argv", ["prog", "api", "repos/owner/repo"]):
-                main()
+            main(["api", "repos/owner/repo"])
 
         out = capsys.readouterr().out
         assert json.loads(out) == body
@@ -357,11 +384,9 @@ class TestCliApiSubcommand:
             mock_client.api.return_value = mock_resp
             mock_get.return_value = mock_client
 
-            from github_data_file_fetcher.cli import main
-            with patch("sys.argv", ["prog", "api", "search/code",
-                                    "--param", "q=filename:SKILL.md",
-                                    "--param", "per_page=100"]):
-                main()
+            main(["api", "search/code",
+                  "--param", "q=filename:SKILL.md",
+                  "--param", "per_page=100"])
 
         mock_client.api.assert_called_once_with(
             "search/code",
@@ -377,10 +402,7 @@ class TestCliApiSubcommand:
             mock_gql.graphql.return_value = gql_result
             MockGQL.return_value = mock_gql
 
-            from github_data_file_fetcher.cli import main
-            with patch("sys.argv", ["prog", "api", "graphql", "--graphql",
-                                    "--query", "{ viewer { login } }"]):
-                main()
+            main(["api", "graphql", "--graphql", "--query", "{ viewer { login } }"])
 
         out = capsys.readouterr().out
         assert json.loads(out) == gql_result
@@ -393,8 +415,6 @@ class TestCliApiSubcommand:
             mock_client.api.return_value = mock_resp
             mock_get.return_value = mock_client
 
-            from github_data_file_fetcher.cli import main
-            with patch("sys.argv", ["prog", "api", "repos/o/r", "--skip-cache"]):
-                main()
+            main(["api", "repos/o/r", "--skip-cache"])
 
         mock_get.assert_called_once_with(skip_cache=True)